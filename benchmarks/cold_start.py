@@ -0,0 +1,125 @@
+"""
+Cold start benchmark: `import cosmospl` and the first request in fresh processes.
+
+Every run starts a new interpreter, as a serverless cold start would, and
+times importing cosmospl then connecting and making a first query. The network
+is replaced by canned responses at the httpx transport level so only
+cosmospl's own startup cost is measured, unless --live is given, in which case
+the account in the cosmos environment variable is used.
+
+    python benchmarks/cold_start.py --runs 20 --max-import-ms 150
+
+Exits with status 1 when the median import time is above --max-import-ms or
+when a dict query imported polars, so it can gate startup regressions in CI.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = r"""
+import json, sys, time
+
+start = time.perf_counter()
+import cosmospl
+imported = time.perf_counter()
+
+import asyncio
+import httpx
+
+live = sys.argv[1] == "live"
+if not live:
+    import base64, os
+
+    os.environ["cosmos"] = (
+        "AccountEndpoint=https://bench.documents.azure.com:443/;"
+        "AccountKey=" + base64.b64encode(b"k" * 32).decode()
+    )
+    META = {"id": "c", "partitionKey": {"paths": ["/pk"], "kind": "Hash"}}
+    RANGES = {"PartitionKeyRanges": [{"id": "0"}]}
+    PAGE = b'{"_rid":"x","Documents":[{"id":"1","pk":"a"}],"_count":1}'
+
+    def respond(request):
+        path = request.url.path
+        if path.endswith("pkranges"):
+            return httpx.Response(200, json=RANGES)
+        if request.method == "POST":
+            return httpx.Response(200, content=PAGE, headers={"x-ms-item-count": "1"})
+        return httpx.Response(200, json=META)
+
+    async def respond_async(self, request):
+        return respond(request)
+
+    httpx.HTTPTransport.handle_request = lambda self, request: respond(request)
+    httpx.AsyncHTTPTransport.handle_async_request = respond_async
+
+db, container = sys.argv[2], sys.argv[3]
+
+
+async def first_request():
+    cosdb = cosmospl.Cosmos(db, container, global_client=None)
+    return await cosdb.query("select top 1 * from c")
+
+
+asyncio.run(first_request())
+done = time.perf_counter()
+print(
+    json.dumps(
+        {
+            "import_ms": (imported - start) * 1000,
+            "first_request_ms": (done - imported) * 1000,
+            "polars_loaded": "polars" in sys.modules,
+        }
+    )
+)
+"""
+
+
+def run_once(db: str, container: str, *, live: bool) -> dict:
+    """Time one cold start in a new interpreter."""
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, "live" if live else "mock", db, container],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    """Run the benchmark and report medians."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--db", default="db")
+    parser.add_argument("--container", default="container")
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    results = [
+        run_once(args.db, args.container, live=args.live) for _ in range(args.runs)
+    ]
+    import_ms = statistics.median(x["import_ms"] for x in results)
+    first_ms = statistics.median(x["first_request_ms"] for x in results)
+    polars_loaded = any(x["polars_loaded"] for x in results)
+    print(f"runs:                 {args.runs}")
+    print(f"import cosmospl:      {import_ms:.1f} ms (median)")
+    print(f"first dict query:     {first_ms:.1f} ms (median)")
+    print(f"polars imported:      {polars_loaded}")
+
+    failed = False
+    if polars_loaded:
+        print("FAIL: a dict query imported polars")
+        failed = True
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"FAIL: import took more than {args.max_import_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
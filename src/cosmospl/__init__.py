@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import asyncio
 import base64
-import contextlib
 import hashlib
 import hmac
+import importlib.util
 import logging
 import os
+import re
+import sys
 import time
 import warnings
 from datetime import datetime, timezone
@@ -14,6 +16,9 @@ from typing import (
     TYPE_CHECKING,
     Any,
     AsyncGenerator,
+    Awaitable,
+    Callable,
+    Iterator,
     Literal,
     TypeAlias,
     cast,
@@ -24,27 +29,78 @@ from urllib.parse import quote, quote_plus
 import httpx
 import orjson
 
+from cosmospl.bulk import iter_batches, iter_document_bodies, send_bodies
+from cosmospl.coalesce import SingleFlight
 from cosmospl.exceptions import (
     MustSpecifyPartitionKey,
     NoDocuments,
+    PartitionKeyRangeGone,
     Resp401,
     RespFail,
     UnsupportedPartitionKey,
 )
+from cosmospl.export import export_query
+from cosmospl.feedrange import scan_container
+from cosmospl.merge import RowBudget, interleave, iter_documents, plan_query
+from cosmospl.pagesize import PageSizer
+from cosmospl.partition import (
+    effective_partition_key,
+    is_hierarchical,
+    key_values,
+    overlapping_ranges,
+    partition_key_header,
+    partition_key_of,
+    partition_key_paths,
+    prefix_epk_range,
+)
+from cosmospl.regions import RegionRouter
+from cosmospl.scan import scan_cosmos as scan_cosmos
+from cosmospl.session import SessionTokens
+from cosmospl.tracing import RequestTimer, current_span, start_span
 
 # Import polars for type checking only
 if TYPE_CHECKING:
-    import polars as plt
+    from pathlib import Path
 
-# Attempt to import polars at runtime
-pl = None
-with contextlib.suppress(ModuleNotFoundError):
     import polars as pl
+    import polars as plt
+
+    from cosmospl.cache import QueryCache
+    from cosmospl.export import EXPORT_FORMATS
+    from cosmospl.partition import PartitionKey
+    from cosmospl.tracing import Span, Tracer
+
+
+class _LazyPolars:
+    """
+    Stands in for the polars module until it is first used.
+
+    Importing polars takes longer than everything else cosmospl needs, so it
+    is only imported once a polars return mode is used. The first attribute
+    access imports it and replaces this object with the real module.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        import polars
+
+        globals()["pl"] = polars
+        return getattr(polars, name)
+
 
-ALLOWED_RETURNS: TypeAlias = Literal["dict", "pl", "raw", "pljson", "resp"]
+# pl is None when polars isn't installed
+if not TYPE_CHECKING:
+    pl = None if importlib.util.find_spec("polars") is None else _LazyPolars()
+
+ALLOWED_RETURNS: TypeAlias = Literal["dict", "pl", "raw", "pljson", "resp", "json"]
 DOC_STR = 'Documents":['
 COUNT_STR = ',"_count"'
+_COUNT_VALUE = re.compile(rb"\s*:\s*(\d+)")
+# max_item value that sizes pages from observed response sizes and latencies
+ADAPTIVE_PAGES = "auto"
+# timeout, throttled, retry-with and unavailable: worth sending again
+_TRANSIENT_STATUS = (408, 429, 449, 503)
 RESOURCE_TYPES: TypeAlias = Literal[
+    "",  # the database account itself
     "dbs",
     "colls",
     "sprocs",
@@ -55,6 +111,7 @@ RESOURCE_TYPES: TypeAlias = Literal[
     "docs",
     "pkranges",
 ]
+SCRIPT_TYPES: TypeAlias = Literal["sprocs", "udfs", "triggers"]
 
 
 class CosAuth(httpx.Auth):  # noqa: D101
@@ -74,16 +131,17 @@ class CosAuth(httpx.Auth):  # noqa: D101
         -------
             asyncio.Generator[httpx.Request]: _description_
         """
+        start = time.perf_counter()
         verb = request.method.lower()
         assert isinstance(verb, str)
         resource_type = request.headers.get("resource_type")
         request.headers.pop("resource_type")
 
-        resource_id = request.url.path
-        while resource_id[0] == "/":
-            resource_id = resource_id[1:]
+        resource_id = request.url.path.lstrip("/")
         resource_id_split = resource_id.split("/")
-        if resource_id_split[-1] == "docs" or resource_id_split[-1] == "pkranges":
+        # feeds like dbs/x/colls/y/docs have an odd number of segments and are
+        # signed with their parent's link, items with their own
+        if len(resource_id_split) % 2 == 1:
             resource_id = "/".join(resource_id_split[:-1])
         working_dt = datetime.now(tz=timezone.utc)
         # while True:
@@ -95,6 +153,8 @@ class CosAuth(httpx.Auth):  # noqa: D101
         #     break
         request.headers["x-ms-date"] = x_date
         request.headers["authorization"] = auth
+        if "trace" in request.extensions:
+            request.extensions["cosmos.sign_ms"] = (time.perf_counter() - start) * 1000
         yield request
 
     def auth_flow(self, request: httpx.Request):
@@ -108,16 +168,17 @@ class CosAuth(httpx.Auth):  # noqa: D101
         -------
             asyncio.Generator[httpx.Request, httpx.Response, None]: _description_
         """
+        start = time.perf_counter()
         verb = request.method.lower()
         assert isinstance(verb, str)
         resource_type = request.headers.get("resource_type")
         request.headers.pop("resource_type")
 
-        resource_id = request.url.path
-        while resource_id[0] == "/":
-            resource_id = resource_id[1:]
+        resource_id = request.url.path.lstrip("/")
         resource_id_split = resource_id.split("/")
-        if resource_id_split[-1] == "docs" or resource_id_split[-1] == "pkranges":
+        # feeds like dbs/x/colls/y/docs have an odd number of segments and are
+        # signed with their parent's link, items with their own
+        if len(resource_id_split) % 2 == 1:
             resource_id = "/".join(resource_id_split[:-1])
         working_dt = datetime.now(tz=timezone.utc)
         # while True:
@@ -129,6 +190,8 @@ class CosAuth(httpx.Auth):  # noqa: D101
         #     break
         request.headers["x-ms-date"] = x_date
         request.headers["authorization"] = auth
+        if "trace" in request.extensions:
+            request.extensions["cosmos.sign_ms"] = (time.perf_counter() - start) * 1000
         yield request
 
 
@@ -190,6 +253,105 @@ def get_inner_content(resp: bytes, check_docs=True, check_count=True) -> bytes:
     return resp[begin_char:end_char]
 
 
+def documents_span(resp: bytes) -> tuple[int, int]:
+    """
+    Find the Documents array of a query response without parsing it.
+
+    Args:
+        resp (bytes): A query response page
+
+    Returns
+    -------
+    tuple[int, int]: start and end offsets of the array, brackets included
+    """
+    start = resp.find(b'"' + DOC_STR.encode())
+    end = resp.rfind(COUNT_STR.encode())
+    if start == -1:
+        msg = "can't find Documents"
+        raise NoDocuments(msg)
+    if end == -1:
+        msg = "can't find ending counts"
+        raise ValueError(msg)
+    return (start + len(DOC_STR), end)
+
+
+def join_documents(pages: list[bytes], limit: int | None = None) -> bytes:
+    """
+    Merge the Documents of many query response pages into one json array.
+
+    Each page's Documents region is sliced out with a memoryview and all of
+    them are joined in a single copy, so the result is ready to send (for
+    instance as a FastAPI Response) without parsing anything. With a limit
+    only the page it falls in is parsed, to cut it short.
+
+    Args:
+        pages (list[bytes]): Query response pages
+        limit (int, optional): Keep at most this many documents.
+
+    Returns
+    -------
+    bytes: A json array of every document
+    """
+    parts: list[bytes | memoryview] = [b"["]
+    remaining = limit
+    for page in pages:
+        if remaining is not None and remaining <= 0:
+            break
+        start, end = documents_span(page)
+        # skip the brackets, an empty page has nothing between them
+        docs: bytes | memoryview = memoryview(page)[start + 1 : end - 1]
+        if remaining is not None:
+            count = _page_count(page, end)
+            if count > remaining:
+                docs = orjson.dumps(orjson.loads(page[start:end])[:remaining])[1:-1]
+                count = remaining
+            remaining -= count
+        if len(docs) > 0:
+            if len(parts) > 1:
+                parts.append(b",")
+            parts.append(docs)
+    parts.append(b"]")
+    return b"".join(parts)
+
+
+def _page_count(page: bytes, end: int) -> int:
+    """The _count of a query response page, `end` being where it starts."""
+    count = _COUNT_VALUE.match(page, end + len(COUNT_STR))
+    if count is None:
+        msg = "can't find ending counts"
+        raise ValueError(msg)
+    return int(count.group(1))
+
+
+def parse_conn_str(conn_str: str) -> tuple[str, str]:
+    """
+    Split a connection string into the account endpoint and key.
+
+    Args:
+        conn_str (str): AccountEndpoint=...;AccountKey=...;
+
+    Returns
+    -------
+        tuple[str, str]: The endpoint without trailing slashes and the key
+    """
+    account_dict = {
+        (y := x.split("=", maxsplit=1))[0]: y[1] for x in conn_str.split(";") if x
+    }
+    url = account_dict["AccountEndpoint"]
+    while url[-1] == "/":
+        url = url[0:-1]
+    return url, account_dict["AccountKey"]
+
+
+def _base_headers(resource_type: RESOURCE_TYPES) -> dict[str, str]:
+    # The resource_type header is for the auth class and is popped before sending
+    return {
+        "x-ms-version": "2020-07-15",
+        "resource_type": resource_type,
+        "user-agent": "python-cosmospl",
+    }
+
+
 def _gen_sig(
     verb: str,
     resource_type: str,
@@ -228,62 +390,199 @@ class Cosmos:
         db: str,
         container: str,
         conn_str: str | None = None,
-        default_partition_key: str | None = None,
+        default_partition_key: PartitionKey | None = None,
         global_client: str | None = "__COSMOS",
         max_retries: int = 5,
+        *,
+        preferred_locations: list[str] | None = None,
+        hedge_reads: bool = False,
+        page_target_bytes: int | None = 1_000_000,
+        page_target_seconds: float | None = None,
+        coalesce_reads: bool = False,
+        tracer: Tracer | None = None,
+        account: CosmosAccount | None = None,
+        query_cache: QueryCache | None = None,
     ):
+        """
+        Connect to a Cosmos container.
+
+        Args:
+            db (str): Database name
+            container (str): Container name
+            conn_str (str, optional): Connection string, defaults to the cosmos
+            environment variable.
+            default_partition_key (str, optional): Partition key used when none
+            is given.
+            global_client (str, optional): Name under which the httpx client is
+            shared between instances. None for a private client.
+            max_retries (int): The max_retries for requests
+            preferred_locations (list[str], optional): Regions (e.g. "West US")
+            to read from, in order of preference. Enables reading from the
+            account's replicas, other regions are ordered by observed latency.
+            hedge_reads (bool): Send a second read to the next region when the
+            first is slower than its p95 latency and use whichever finishes
+            first. Enables regional reads even without preferred_locations.
+            page_target_bytes (int, optional): Response size queries with
+            max_item="auto" aim for per page.
+            page_target_seconds (float, optional): Latency queries with
+            max_item="auto" aim for per page.
+            coalesce_reads (bool): Identical `read` and `query` calls made while
+            one is already in flight share its request instead of sending
+            their own.
+            tracer (Tracer, optional): Receives a span per operation, HTTP
+            request and decode, with phase timings. An OpenTelemetry tracer
+            works as is, see `cosmospl.tracing`. None traces nothing.
+            account (CosmosAccount, optional): Use the account's connection
+            pool, regions, metadata cache and the container's session tokens
+            instead of conn_str and global_client. See
+            `CosmosAccount.container`.
+            query_cache (QueryCache, optional): Serve repeated `query` calls
+            from this cache, dropping results when this instance writes to
+            their partition. raw and resp queries aren't cached.
+        """
         self.max_retries = max_retries
-        if conn_str is None and "cosmos" in os.environ:
-            conn_str = os.environ["cosmos"]  # noqa: SIM112
-        assert conn_str is not None
+        self.account = account
         self.db = db
 
         self.container = container
-        self.session = None
+        self.page_sizer = PageSizer(page_target_bytes, page_target_seconds)
+        self._range_bounds: dict[str, tuple[str, str]] = {}
+        if account is not None:
+            # every handle of the container sees the others' writes and joins
+            # their in-flight reads
+            self.sessions, single_flight = account._container_state(db, container)
+        else:
+            self.sessions, single_flight = SessionTokens(), SingleFlight()
+        self.single_flight = single_flight if coalesce_reads else None
+        self.tracer = tracer
+        self.query_cache = query_cache
         self.partition_key = default_partition_key
 
-        account_dict = {
-            (y := x.split("=", maxsplit=1))[0]: y[1] for x in conn_str.split(";")
-        }
-        url = account_dict["AccountEndpoint"]
-        while url[-1] == "/":
-            url = url[0:-1]
+        if account is not None:
+            self.base_url = account.base_url
+            self.client = account.client
+            self.regions: RegionRouter | None = account.regions
+            if preferred_locations is not None or hedge_reads:
+                self.regions = RegionRouter(
+                    self.base_url, preferred_locations, hedge=hedge_reads
+                )
+            meta = account.container_meta.get((db, container))
+            if meta is None:
+                meta = self._get_container_meta_sync()
+                assert isinstance(meta, dict)
+                account.container_meta[(db, container)] = meta
+            self._set_meta(meta)
+            return
+
+        if conn_str is None and "cosmos" in os.environ:
+            conn_str = os.environ["cosmos"]  # noqa: SIM112
+        assert conn_str is not None
+        url, key = parse_conn_str(conn_str)
         self.base_url = url
+        self.regions = None
+        if preferred_locations is not None or hedge_reads:
+            self.regions = RegionRouter(url, preferred_locations, hedge=hedge_reads)
         if global_client is None:
-            self.client = httpx.AsyncClient(
-                auth=CosAuth(account_dict["AccountKey"]), http2=True
-            )
+            self.client = httpx.AsyncClient(auth=CosAuth(key), http2=True)
         else:
             if global_client not in globals():
                 globals()[global_client] = httpx.AsyncClient(
-                    auth=CosAuth(account_dict["AccountKey"]), http2=True
+                    auth=CosAuth(key), http2=True
                 )
             self.client = globals()[global_client]
 
         meta = self._get_container_meta_sync()
         assert meta is not None
         assert isinstance(meta, dict)
+        self._set_meta(meta)
+
+    def _set_meta(self, meta: dict[str, Any]):
         self.meta = meta
-        if (
-            "partitionKey" in cast(dict, meta)
-            and "paths" in cast(dict, meta)["partitionKey"]
-            and len(cast(dict, meta)["partitionKey"]["paths"]) == 1
-        ):
-            part_name = cast(dict, meta)["partitionKey"]["paths"][0]
-            while part_name[0] == "/":
-                part_name = part_name[1:]
-            self.partition_key_name = part_name
-        else:
+        self.partition_key_paths = partition_key_paths(meta)
+        self.hierarchical = is_hierarchical(meta)
+        # the single partition key property, None for hierarchical keys
+        self.partition_key_name: str | None = None
+        if len(self.partition_key_paths) == 1:
+            self.partition_key_name = self.partition_key_paths[0]
+        elif not self.hierarchical:
             warnings.warn(
                 str(meta),
                 category=UnsupportedPartitionKey,
                 stacklevel=2,
             )
 
-    def set_default_partition_key(self, default_partition_key: str | None = None):
+    @property
+    def session(self) -> str | None:
+        """Compound session token of every pk range seen so far."""
+        return self.sessions.get()
+
+    def set_default_partition_key(
+        self, default_partition_key: PartitionKey | None = None
+    ):
         """Change default partition key to be used in queries."""
         self.partition_key = default_partition_key
 
+    def _page_size(
+        self, max_item: int | str | None, pk_id: str | int | None = None
+    ) -> int | str | None:
+        """The max item count to send, picked by the page sizer for "auto"."""
+        if max_item == ADAPTIVE_PAGES:
+            return self.page_sizer.size(pk_id)
+        return max_item
+
+    def _observe_page(
+        self,
+        max_item: int | str | None,
+        pk_id: str | int | None,
+        resp: httpx.Response,
+        size: int,
+        seconds: float,
+    ):
+        """Feed a received page to the page sizer when max_item is "auto"."""
+        if max_item != ADAPTIVE_PAGES:
+            return
+        self.page_sizer.observe(
+            pk_id,
+            int(resp.request.headers.get("x-ms-max-item-count", 0)),
+            int(resp.headers.get("x-ms-item-count", 0)),
+            size,
+            seconds,
+        )
+
+    def _session_range(self, partition_key: PartitionKey | None) -> str | None:
+        """
+        The pk range a full partition key lives in, from pk ranges already seen.
+
+        Lets a request routed by partition key send just that range's session
+        token. None when the range can't be told without a request: no key or
+        a prefix, a container hashed with the old V1 scheme, or no pk ranges
+        seen yet.
+        """
+        if partition_key is None or self._is_prefix(partition_key):
+            return None
+        if (
+            not self.hierarchical
+            and self.meta.get("partitionKey", {}).get("version") != 2
+        ):
+            return None
+        if len(self._range_bounds) == 0 and self.account is not None:
+            cached = self.account._pk_ranges.get((self.db, self.container))
+            if cached is not None:
+                self._route(None, orjson.loads(cached[1].content)["PartitionKeyRanges"])
+        if len(self._range_bounds) == 0:
+            return None
+        try:
+            epk = effective_partition_key(key_values(partition_key))
+        except TypeError:
+            return None
+        found = [
+            range_id
+            for range_id, (low, high) in self._range_bounds.items()
+            if low <= epk < high
+        ]
+        # after a split the gone range still overlaps its replacements
+        return found[0] if len(found) == 1 else None
+
     def _make_headers(
         self,
         *,
@@ -292,15 +591,10 @@ class Cosmos:
         resource_type: RESOURCE_TYPES = "docs",
         max_item: int | str | None = None,
         continuation: str | None = None,
-        partition_key: str | None = None,
+        partition_key: PartitionKey | None = None,
         pk_id: str | int | None = None,
     ):
-        headers = {
-            "x-ms-version": "2020-07-15",
-            "resource_type": resource_type,
-            "user-agent": "python-cosmospl",
-        }
-        # The resource_type header is for the auth class and is popped before sending
+        headers = _base_headers(resource_type)
         if pk_id is not None:
             headers["x-ms-documentdb-partitionkeyrangeid"] = str(pk_id)
         if is_upsert is not None:
@@ -308,7 +602,9 @@ class Cosmos:
         if partition_key is None:
             partition_key = self.partition_key
         if partition_key is not None:
-            headers["x-ms-documentdb-partitionkey"] = '["' + partition_key + '"]'
+            headers["x-ms-documentdb-partitionkey"] = partition_key_header(
+                partition_key
+            )
         if is_query is not None:
             headers["x-ms-documentdb-isquery"] = str(is_query).lower()
             if is_query is True:
@@ -318,9 +614,18 @@ class Cosmos:
                 else:
                     headers["x-ms-documentdb-query-enablecrosspartition"] = "false"
         if max_item is not None:
-            headers["x-ms-max-item-count"] = str(max_item)
-        if self.session is not None:
-            headers["x-ms-session-token"] = self.session
+            headers["x-ms-max-item-count"] = str(self._page_size(max_item, pk_id))
+        if pk_id is not None or resource_type != "docs":
+            session = self.sessions.get(pk_id)
+        else:
+            session_range = self._session_range(partition_key)
+            session = (
+                None if session_range is None else self.sessions.get(session_range)
+            )
+            if session is None:
+                session = self.sessions.get()
+        if session is not None:
+            headers["x-ms-session-token"] = session
         if continuation is not None:
             headers["x-ms-continuation"] = continuation
 
@@ -332,10 +637,11 @@ class Cosmos:
         query: str,
         *,
         params: list[dict[str, str]] | None = ...,
-        partition_key: str | None = ...,
+        partition_key: PartitionKey | None = ...,
         max_item: int | str | None = ...,
         max_retries: int | None = ...,
         pk_id: str | list[str] | None = ...,
+        limit: int | None = ...,
     ) -> list[dict[str, float | int | str | bool | None]]: ...
 
     @overload
@@ -344,10 +650,11 @@ class Cosmos:
         query: str,
         *,
         params: list[dict[str, str]] | None = ...,
-        partition_key: str | None = ...,
+        partition_key: PartitionKey | None = ...,
         max_item: int | str | None = ...,
         max_retries: int | None = ...,
         pk_id: str | list[str] | None = ...,
+        limit: int | None = ...,
         return_as: Literal["dict"],
     ) -> list[dict[str, float | int | str | bool | None]]: ...
 
@@ -357,10 +664,11 @@ class Cosmos:
         query: str,
         *,
         params: list[dict[str, str]] | None = ...,
-        partition_key: str | None = ...,
+        partition_key: PartitionKey | None = ...,
         max_item: int | str | None = ...,
         max_retries: int | None = ...,
         pk_id: str | list[str] | None = ...,
+        limit: int | None = ...,
         return_as: Literal["pl", "pljson"],
     ) -> plt.DataFrame: ...
 
@@ -370,10 +678,11 @@ class Cosmos:
         query: str,
         *,
         params: list[dict[str, str]] | None = ...,
-        partition_key: str | None = ...,
+        partition_key: PartitionKey | None = ...,
         max_item: int | str | None = ...,
         max_retries: int | None = ...,
         pk_id: str | list[str] | None = ...,
+        limit: int | None = ...,
         return_as: Literal["raw"],
     ) -> bytes | list[bytes]: ...
 
@@ -383,10 +692,25 @@ class Cosmos:
         query: str,
         *,
         params: list[dict[str, str]] | None = ...,
-        partition_key: str | None = ...,
+        partition_key: PartitionKey | None = ...,
+        max_item: int | str | None = ...,
+        max_retries: int | None = ...,
+        pk_id: str | list[str] | None = ...,
+        limit: int | None = ...,
+        return_as: Literal["json"],
+    ) -> bytes: ...
+
+    @overload
+    async def query(
+        self,
+        query: str,
+        *,
+        params: list[dict[str, str]] | None = ...,
+        partition_key: PartitionKey | None = ...,
         max_item: int | str | None = ...,
         max_retries: int | None = ...,
         pk_id: str | list[str] | None = ...,
+        limit: int | None = ...,
         return_as: Literal["resp"],
     ) -> httpx.Response | list[httpx.Response]: ...
 
@@ -395,11 +719,12 @@ class Cosmos:
         query: str,
         *,
         params: list[dict[str, str]] | None = None,
-        partition_key: str | None = None,
+        partition_key: PartitionKey | None = None,
         return_as: ALLOWED_RETURNS = "dict",
         max_item: int | str | None = None,
         max_retries: int | None = None,
         pk_id: str | list[str] | None = None,
+        limit: int | None = None,
     ):
         """
         Perform query and return all results.
@@ -407,57 +732,513 @@ class Cosmos:
         Args:
             query (str): SQL query
             params (List[Dict[str, str]], optional): Params for query or None.
-            partition_key (str, optional): The partition key. If none then cross
-            partition is enabled.
-            return_as: The return type either dict, pl, raw, resp
-            max_item (int | str, optional): Max items per request.
+            partition_key (PartitionKey, optional): The partition key, a str,
+            number or bool, or a list of values for a hierarchical key. A list
+            of only the leading levels queries just the pk ranges holding that
+            prefix. If none then cross partition is enabled.
+            return_as: The return type either dict, pl, raw, resp, json. json is
+            a single json array of every document, ready to be sent as is.
+            max_item (int | str, optional): Max items per request. "auto" sizes
+            each pk range's pages from the size and latency of its recent ones.
             max_retries: The max_retries for Auth
+            limit (int, optional): Stop after this many documents across all pk
+            ranges. Page requests ask only for what is still needed and the
+            remaining page requests are cancelled once it is reached. raw and
+            resp returns are cut at page granularity.
 
         Returns
         -------
             _type_: _description_
+
+        Notes
+        -----
+            When the query spans more than one pk range, ORDER BY, TOP, OFFSET
+            LIMIT and aggregates (without GROUP BY) are merged client side so
+            the result matches a single range query. Merging applies to dict,
+            pl, pljson and json returns; raw and resp return the pages of each
+            range as Cosmos sent them.
+
+            With a query_cache, dict, pl, pljson and json results are kept as
+            json and decoded for every call, whichever return mode stored them.
+
+            With coalesce_reads, identical concurrent queries share one
+            execution. dict results are decoded separately for every caller and
+            DataFrames are zero-copy clones, so callers can't affect each other.
         """
         if return_as in ["pl", "pljson"] and pl is None:
             msg = f"can't use return_as={return_as} without polars installed"
             raise ValueError(msg)
         if max_retries is None:
             max_retries = self.max_retries
-
-        if pk_id is None:
-            pk_ids = [
-                cast(str, x["id"])
-                for x in (await self.get_pk_ranges())["PartitionKeyRanges"]
-            ]
-        elif not isinstance(pk_id, list):
-            pk_ids = [pk_id]
+        if self.query_cache is not None and return_as not in ["raw", "resp"]:
+            result = self._query_cached(
+                query,
+                params,
+                partition_key,
+                return_as,
+                max_item,
+                max_retries,
+                pk_id,
+                limit,
+            )
         else:
-            pk_ids = pk_id
-        results = await asyncio.gather(
-            *[
-                self._query(
-                    query,
-                    params,
-                    partition_key,
-                    return_as,
-                    max_item,
-                    0,
-                    max_retries,
-                    pk_id_,
-                )
-                for pk_id_ in pk_ids
+            result = self._query_shared(
+                query,
+                params,
+                partition_key,
+                return_as,
+                max_item,
+                max_retries,
+                pk_id,
+                limit,
+            )
+        if self.tracer is not None:
+            result = self._traced_operation(
+                "cosmos.query",
+                {
+                    "cosmos.query": query,
+                    "cosmos.return_as": return_as,
+                    **self._partition_key_attribute(partition_key),
+                },
+                result,
+            )
+        return await result
+
+    async def _query_shared(
+        self,
+        query: str,
+        params: list[dict[str, str]] | None,
+        partition_key: PartitionKey | None,
+        return_as: ALLOWED_RETURNS,
+        max_item: int | str | None,
+        max_retries: int,
+        pk_id: str | list[str] | None,
+        limit: int | None,
+    ):
+        if self.single_flight is None:
+            return await self._query_all(
+                query,
+                params,
+                partition_key,
+                return_as,
+                max_item,
+                max_retries,
+                pk_id,
+                limit,
+            )
+        # dict callers share the json bytes and each decode their own copy
+        shared_as = "json" if return_as == "dict" else return_as
+        key = (
+            "query",
+            self._coalesce_scope(partition_key),
+            query,
+            orjson.dumps(params),
+            shared_as,
+            max_item,
+            str(pk_id),
+            limit,
+        )
+        shared = await self.single_flight.do(
+            key,
+            lambda: self._query_all(
+                query,
+                params,
+                partition_key,
+                shared_as,
+                max_item,
+                max_retries,
+                pk_id,
+                limit,
+            ),
+        )
+        if return_as == "dict":
+            return orjson.loads(shared)
+        if return_as in ["pl", "pljson"]:
+            return shared.clone()
+        if isinstance(shared, list):
+            return list(shared)
+        return shared
+
+    async def _query_cached(
+        self,
+        query: str,
+        params: list[dict[str, str]] | None,
+        partition_key: PartitionKey | None,
+        return_as: ALLOWED_RETURNS,
+        max_item: int | str | None,
+        max_retries: int,
+        pk_id: str | list[str] | None,
+        limit: int | None,
+    ):
+        assert self.query_cache is not None
+        container = self._cache_container()
+        key = self.partition_key if partition_key is None else partition_key
+        # queries pinned to pk ranges count as cross partition for invalidation
+        scope = None if key is None or pk_id is not None else key_values(key)
+        cache_key = (
+            container,
+            None if scope is None else partition_key_header(scope),
+            query,
+            orjson.dumps(params),
+            str(pk_id),
+            limit,
+        )
+        content = self.query_cache.get(cache_key)
+        if content is None:
+            generation = self.query_cache.generation(container)
+            content = await self._query_shared(
+                query,
+                params,
+                partition_key,
+                "json",
+                max_item,
+                max_retries,
+                pk_id,
+                limit,
+            )
+            self.query_cache.put(cache_key, content, container, scope, generation)
+        if return_as == "json":
+            return content
+        if return_as == "dict":
+            return orjson.loads(content)
+        assert pl is not None
+        return pl.read_json(content)
+
+    def _cache_container(self) -> tuple[str, str, str]:
+        return (self.base_url, self.db, self.container)
+
+    def _invalidate_cache(self, partition_key: PartitionKey | None):
+        """Drop cached query results a write to `partition_key` can change."""
+        if self.query_cache is None:
+            return
+        self.query_cache.invalidate(
+            self._cache_container(),
+            None if partition_key is None else key_values(partition_key),
+        )
+
+    async def _traced_operation(
+        self, name: str, attributes: dict[str, Any], operation: Awaitable[Any]
+    ) -> Any:
+        assert self.tracer is not None
+        span = start_span(
+            self.tracer,
+            name,
+            {"cosmos.db": self.db, "cosmos.container": self.container, **attributes},
+        )
+        token = current_span.set(span)
+        try:
+            result = await operation
+        except BaseException as err:
+            span.record_exception(err)
+            span.end()
+            raise
+        finally:
+            current_span.reset(token)
+        if isinstance(result, list) or (
+            "polars" in sys.modules and isinstance(result, pl.DataFrame)
+        ):
+            span.set_attribute("cosmos.rows", len(result))
+        span.end()
+        return result
+
+    def _partition_key_attribute(
+        self, partition_key: PartitionKey | None
+    ) -> dict[str, str]:
+        # span attributes can't be None or mixed lists, the header form is used
+        key = self.partition_key if partition_key is None else partition_key
+        if key is None:
+            return {}
+        return {"cosmos.partition_key": partition_key_header(key)}
+
+    def _request_span(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str] | None,
+        attempt: int,
+        page: int = 0,
+    ) -> Span:
+        assert self.tracer is not None
+        headers = headers or {}
+        attributes: dict[str, Any] = {
+            "http.request.method": method,
+            "url.path": url[len(self.base_url) :],
+            "cosmos.continued": "x-ms-continuation" in headers,
+            "cosmos.page": page,
+            "cosmos.retry_attempt": attempt,
+        }
+        if "x-ms-documentdb-partitionkeyrangeid" in headers:
+            attributes["cosmos.pk_range_id"] = headers[
+                "x-ms-documentdb-partitionkeyrangeid"
             ]
+        if "x-ms-documentdb-partitionkey" in headers:
+            attributes["cosmos.partition_key"] = headers["x-ms-documentdb-partitionkey"]
+        return start_span(self.tracer, "cosmos.request", attributes)
+
+    @staticmethod
+    def _end_request_span(
+        span: Span,
+        resp: httpx.Response,
+        timer: RequestTimer,
+        size: int | None = None,
+    ):
+        # streamed responses pass the size, their content isn't kept
+        span.set_attribute("http.response.status_code", resp.status_code)
+        span.set_attribute(
+            "cosmos.response_bytes", len(resp.content) if size is None else size
+        )
+        span.set_attribute(
+            "cosmos.item_count", int(resp.headers.get("x-ms-item-count", 0))
+        )
+        span.set_attribute(
+            "cosmos.request_charge", float(resp.headers.get("x-ms-request-charge", 0))
+        )
+        if "cosmos.sign_ms" in resp.request.extensions:
+            span.set_attribute(
+                "cosmos.sign_ms", resp.request.extensions["cosmos.sign_ms"]
+            )
+        for phase, ms in timer.phases().items():
+            span.set_attribute(f"cosmos.{phase}", ms)
+        span.end()
+
+    async def _traced_request(
+        self,
+        send: Callable[..., Awaitable[httpx.Response]],
+        method: str,
+        url: str,
+        attempt: int,
+        page: int = 0,
+        **kwargs,
+    ) -> httpx.Response:
+        timer = RequestTimer()
+        span = self._request_span(method, url, kwargs.get("headers"), attempt, page)
+        try:
+            resp = await send(method, url, extensions={"trace": timer.atrace}, **kwargs)
+        except BaseException as err:
+            span.record_exception(err)
+            span.end()
+            raise
+        self._end_request_span(span, resp, timer)
+        return resp
+
+    def _coalesce_scope(self, partition_key: PartitionKey | None) -> tuple:
+        """What besides the request itself decides whether two reads match."""
+        return (
+            self.base_url,
+            self.db,
+            self.container,
+            None
+            if (key := self.partition_key if partition_key is None else partition_key)
+            is None
+            else partition_key_header(key),
+            # a write since the in-flight read started changes the token, so
+            # reads that must see it don't join the older read
+            self.sessions.get(),
+        )
+
+    def _is_prefix(self, partition_key: PartitionKey | None) -> bool:
+        """Whether a key gives only the leading levels of a hierarchical key."""
+        return (
+            self.hierarchical
+            and partition_key is not None
+            and len(key_values(partition_key)) < len(self.partition_key_paths)
+        )
+
+    async def _targets(
+        self, partition_key: PartitionKey | None, pk_id: str | list[str] | None
+    ) -> tuple[list[str | None], dict[str, tuple[str, str]]]:
+        """
+        Where to send a query: pk range ids and the EPK range within each.
+
+        A full partition key is sent once and routed by the gateway. A prefix
+        of a hierarchical key is sent to just the pk ranges its EPK range
+        overlaps, limited to that range. Otherwise every pk range is queried.
+        """
+        if pk_id is not None:
+            return (pk_id if isinstance(pk_id, list) else [pk_id]), {}  # type: ignore
+        key = self.partition_key if partition_key is None else partition_key
+        if key is not None and not self._is_prefix(key):
+            return self._route(key, [])
+        return self._route(key, await self._pk_range_list())
+
+    async def _pk_range_list(self, *, refresh: bool = False) -> list[dict[str, Any]]:
+        """The container's pk ranges, refresh skips the account's cache."""
+        resp = await self._fetch_pk_ranges(refresh=refresh)
+        # internal lookups aren't traced as decodes of a result
+        return self._convert(resp, "dict")["PartitionKeyRanges"]
+
+    async def _replacement_ranges(
+        self, pk_id: str | int, epk_range: tuple[str, str] | None
+    ) -> dict[str, tuple[str, str]]:
+        """
+        The pk ranges that now hold the EPKs of a split or merged pk range.
+
+        Args:
+            pk_id (str | int): The gone pk range.
+            epk_range (tuple[str, str], optional): The part of it that was
+            read, all of it if None.
+
+        Returns
+        -------
+            dict[str, tuple[str, str]]: pk range id to the [min, max) within it,
+            empty when the gone range's bounds aren't known
+        """
+        if epk_range is None:
+            epk_range = self._range_bounds.get(str(pk_id))
+        pk_ranges = await self._pk_range_list(refresh=True)
+        self._route(None, pk_ranges)
+        if epk_range is None:
+            return {}
+        return overlapping_ranges(pk_ranges, epk_range)
+
+    def _targets_sync(
+        self, client: httpx.Client, partition_key: PartitionKey | None
+    ) -> tuple[list[str | None], dict[str, tuple[str, str]]]:
+        """`_targets` for sync callers."""
+        key = self.partition_key if partition_key is None else partition_key
+        if key is not None and not self._is_prefix(key):
+            return self._route(key, [])
+        return self._route(key, self._get_pk_ranges_sync(client))
+
+    def _route(
+        self, key: PartitionKey | None, pk_ranges: list[dict[str, Any]]
+    ) -> tuple[list[str | None], dict[str, tuple[str, str]]]:
+        # kept so a range that goes away can be replaced by the ones covering it
+        self._range_bounds.update(
+            {str(x["id"]): (x["minInclusive"], x["maxExclusive"]) for x in pk_ranges}
+        )
+        if self._is_prefix(key):
+            assert key is not None
+            epk_ranges = overlapping_ranges(
+                pk_ranges, prefix_epk_range(key_values(key))
+            )
+            return list(epk_ranges), epk_ranges
+        if key is not None:
+            return [None], {}
+        return [cast(str, x["id"]) for x in pk_ranges], {}
+
+    @staticmethod
+    def _set_epk_range(headers: dict[str, str], epk_range: tuple[str, str]):
+        # the EPK range does the targeting, a key prefix header would be rejected
+        headers.pop("x-ms-documentdb-partitionkey", None)
+        headers["x-ms-documentdb-query-enablecrosspartition"] = "true"
+        headers["x-ms-read-key-type"] = "EffectivePartitionKeyRange"
+        headers["x-ms-start-epk"], headers["x-ms-end-epk"] = epk_range
+
+    async def _query_all(
+        self,
+        query: str,
+        params: list[dict[str, str]] | None,
+        partition_key: PartitionKey | None,
+        return_as: ALLOWED_RETURNS,
+        max_item: int | str | None,
+        max_retries: int,
+        pk_id: str | list[str] | None,
+        limit: int | None,
+    ):
+        args = (query, params, partition_key, return_as, max_item, max_retries)
+        try:
+            return await self._query_routed(*args, pk_id, limit)
+        except PartitionKeyRangeGone:
+            if pk_id is not None:
+                raise
+            # a pk range split or merged since the pk ranges were fetched, route
+            # again on fresh ones. Nothing was returned yet so it starts over.
+            await self._pk_range_list(refresh=True)
+            return await self._query_routed(*args, pk_id, limit)
+
+    async def _query_routed(
+        self,
+        query: str,
+        params: list[dict[str, str]] | None,
+        partition_key: PartitionKey | None,
+        return_as: ALLOWED_RETURNS,
+        max_item: int | str | None,
+        max_retries: int,
+        pk_id: str | list[str] | None,
+        limit: int | None,
+    ):
+        pk_ids, epk_ranges = await self._targets(partition_key, pk_id)
+        plan = (
+            plan_query(query, params)
+            if len(pk_ids) > 1 and return_as in ["dict", "pl", "pljson", "json"]
+            else None
         )
+        if plan is not None:
+            docs = await plan.merge(
+                [
+                    iter_documents(
+                        self._query_pages(
+                            plan.query,
+                            params,
+                            partition_key,
+                            max_item,
+                            pk_id_,
+                            max_retries,
+                            budget,
+                            epk_range=epk_ranges.get(pk_id_),  # type: ignore
+                            reroute=False,
+                        )
+                    )
+                    for pk_id_, budget in zip(pk_ids, plan.budgets(len(pk_ids), limit))
+                ],
+                limit,
+            )
+            if return_as == "dict":
+                return docs
+            if return_as == "json":
+                return orjson.dumps(docs)
+            assert pl is not None
+            return pl.DataFrame(docs)
+        # json pages are joined once at the end rather than per pk range
+        fetch_as = "resp" if return_as == "json" else return_as
+        if limit is not None:
+            pages = []
+            async for resp in self.query_pages(
+                query,
+                params=params,
+                partition_key=partition_key,
+                max_item=max_item,
+                max_retries=max_retries,
+                pk_id=pk_id,
+                limit=limit,
+            ):
+                pages.append(resp)
+            results = [self._decode_pages(pages, fetch_as)]
+        else:
+            results = await asyncio.gather(
+                *[
+                    self._query(
+                        query,
+                        params,
+                        partition_key,
+                        fetch_as,
+                        max_item,
+                        0,
+                        max_retries,
+                        pk_id_,
+                        epk_range=epk_ranges.get(pk_id_),  # type: ignore
+                    )
+                    for pk_id_ in pk_ids
+                ]
+            )
         if return_as == "dict":
             new_results = []
             for res in results:
                 assert isinstance(res, list)
                 new_results.extend(res)
-            return new_results
+            return new_results if limit is None else new_results[:limit]
         if return_as in ["pl", "pljson"]:
             assert pl is not None
             typed_results = [x for x in results if isinstance(x, pl.DataFrame)]
             assert len(typed_results) == len(results)
+            if limit is not None:
+                return pl.concat(typed_results).head(limit)
             return pl.concat(typed_results)
+        if return_as == "json":
+            return join_documents(
+                [resp.content for res in results for resp in cast(list, res)], limit
+            )
         if return_as == "raw" or return_as == "resp":
             flat_return = []
             for res in results:
@@ -478,7 +1259,7 @@ class Cosmos:
         self,
         query: str,
         params: list[dict[str, str]] | None = None,
-        partition_key: str | None = None,
+        partition_key: PartitionKey | None = None,
         return_as: ALLOWED_RETURNS = "dict",
         max_item: int | str | None = None,
         retries: int = 0,
@@ -486,6 +1267,8 @@ class Cosmos:
         pk_id: str | int | None = None,
         continuation: str | None = None,
         prevReturn: list[httpx.Response] | None = None,
+        epk_range: tuple[str, str] | None = None,
+        page: int = 0,
     ):
         """
         Private query meant for recursion with retries.
@@ -507,20 +1290,28 @@ class Cosmos:
         params, body, headers, url = self._prep_query(
             query, params, partition_key, max_item, pk_id, continuation
         )
+        if epk_range is not None:
+            self._set_epk_range(headers, epk_range)
         try:
+            start = time.perf_counter()
             resp = await self._get_resp(
                 url,
                 json=body,
                 headers=headers,
+                attempt=retries,
+                page=page,
             )
             resp.raise_for_status()
-            if "x-ms-session-token" in resp.headers:
-                self.session = resp.headers["x-ms-session-token"]
-        except Resp401:
+            self.sessions.update(resp.headers.get("x-ms-session-token"))
+            self._observe_page(
+                max_item, pk_id, resp, len(resp.content), time.perf_counter() - start
+            )
+        except (Resp401, PartitionKeyRangeGone):
             raise
         except Exception:
             if retries < max_retries:
-                resp = await self._query(
+                # the retry goes on to the remaining pages and decodes them all
+                return await self._query(
                     query,
                     params,
                     partition_key,
@@ -531,10 +1322,10 @@ class Cosmos:
                     pk_id,
                     continuation,
                     prevReturn,
+                    epk_range,
+                    page,
                 )
-                resp = cast(httpx.Response, resp)
-            else:
-                raise
+            raise
         prevReturn.append(resp)
         if "x-ms-continuation" in resp.headers:
             return await self._query(
@@ -543,18 +1334,39 @@ class Cosmos:
                 partition_key,
                 return_as,
                 max_item,
-                retries + 1,
+                0,
                 max_retries,
                 pk_id,
                 resp.headers.get("x-ms-continuation"),
                 prevReturn,
+                epk_range,
+                page + 1,
             )
+        return self._decode_pages(prevReturn, return_as)
+
+    def _decode_pages(self, pages: list[httpx.Response], return_as: ALLOWED_RETURNS):
+        if self.tracer is None:
+            return self._decode(pages, return_as)
+        span = start_span(
+            self.tracer,
+            "cosmos.decode",
+            {
+                "cosmos.return_as": return_as,
+                "cosmos.pages": len(pages),
+                "cosmos.response_bytes": sum(len(resp.content) for resp in pages),
+            },
+        )
+        try:
+            return self._decode(pages, return_as)
+        finally:
+            span.end()
 
+    def _decode(self, pages: list[httpx.Response], return_as: ALLOWED_RETURNS):
         if return_as == "resp":
-            return cast(list[httpx.Response], prevReturn)
+            return cast(list[httpx.Response], pages)
         if return_as == "dict":
             finalReturn = []
-            for resp in prevReturn:
+            for resp in pages:
                 loaded = orjson.loads(resp.content)
                 assert isinstance(loaded, dict)
                 assert "Documents" in loaded
@@ -563,7 +1375,7 @@ class Cosmos:
         if return_as == "pljson" or return_as == "pl":
             assert pl is not None
             finalReturn = []
-            for resp in prevReturn:
+            for resp in pages:
                 if return_as == "pljson":
                     finalReturn.append(
                         pl.read_json(resp.content)
@@ -573,128 +1385,541 @@ class Cosmos:
                 else:
                     finalReturn.append(pl.read_json(get_inner_content(resp.content)))
             return pl.concat(finalReturn)
+        if return_as == "json":
+            return join_documents([resp.content for resp in pages])
 
-        return prevReturn
+        return [resp.content for resp in pages]
 
-    def _prep_query(
+    async def _query_pages(
         self,
         query: str,
-        params: list[dict[str, str]] | None = None,
-        partition_key: str | None = None,
+        params: list[dict[str, Any]] | None = None,
+        partition_key: PartitionKey | None = None,
         max_item: int | str | None = None,
-        pk_id: int | str | None = None,
+        pk_id: str | int | None = None,
+        max_retries: int | None = None,
+        budget: RowBudget | None = None,
         continuation: str | None = None,
-    ):
-        if params is None:
-            params = []
-        body = {"query": query, "parameters": params}
-        # resource_link = f"dbs/{self.db}/colls/{self.container}"
-
-        headers = self._make_headers(
-            is_query=True,
-            resource_type="docs",
-            max_item=max_item,
-            partition_key=partition_key,
-            pk_id=pk_id,
-        )
-        if continuation is not None:
-            headers["x-ms-continuation"] = continuation
-
-        url = self.base_url + f"//dbs/{self.db}/colls/{self.container}/docs"
-        return (params, body, headers, url)
-
-    async def query_stream(
-        self,
-        query: str,
-        params: list[dict[str, str]] | None = None,
-        partition_key: str | None = None,
-        max_item: int | str | None = None,
-    ) -> AsyncGenerator[bytes, None]:
+        epk_range: tuple[str, str] | None = None,
+        *,
+        reroute: bool = True,
+    ) -> AsyncGenerator[httpx.Response, None]:
         """
-        Perform query and return all results as a generator.
+        Perform query against one pk range, yielding one response per page.
+
+        The next continuation page is only requested when the consumer asks for
+        it, so closing the generator stops the query. With a budget, each page
+        asks for at most the rows still needed and the chain stops once none are.
 
         Args:
             query (str): SQL query
-            params (List[Dict[str, str]], optional): Params for query or None.
-            partition_key (str, optional): The partition key. If none then cross
+            params (List[Dict[str, Any]], optional): Params for query or None.
+            partition_key (str, optional): The partition key.
+            max_item (int | str, optional): Max items per request.
+            pk_id (str | int, optional): The pk range id to query.
+            max_retries: The max_retries per page
+            budget (RowBudget, optional): Rows still needed by the caller.
+            continuation (str, optional): Resume from this continuation token.
+            epk_range (tuple[str, str], optional): Only read the documents of
+            pk_id whose effective partition key is within [min, max).
+            reroute (bool): When pk_id was split or merged, read on from the
+            ranges that replaced it, one after another. False raises
+            PartitionKeyRangeGone instead, for callers that need each stream
+            in order.
+
+        Returns
+        -------
+            AsyncGenerator[httpx.Response]: One response per continuation page
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        params, body, headers, url = self._prep_query(
+            query, params, partition_key, max_item, pk_id, continuation
+        )
+        if epk_range is not None:
+            self._set_epk_range(headers, epk_range)
+        retries = 0
+        page = 0
+        while True:
+            page_max = sized = self._page_size(max_item, pk_id)
+            if budget is not None:
+                if budget.remaining <= 0:
+                    return
+                page_max = budget.page_size(page_max)
+            if page_max is not None:
+                headers["x-ms-max-item-count"] = str(page_max)
+            try:
+                start = time.perf_counter()
+                resp = await self._get_resp(
+                    url, json=body, headers=headers, attempt=retries, page=page
+                )
+            except PartitionKeyRangeGone:
+                if pk_id is None or not reroute:
+                    raise
+                replacements = await self._replacement_ranges(pk_id, epk_range)
+                if len(replacements) == 0:
+                    raise
+                for pk_id_, epk_range_ in replacements.items():
+                    async for resp in self._query_pages(
+                        query,
+                        params,
+                        partition_key,
+                        max_item,
+                        pk_id_,
+                        max_retries,
+                        budget,
+                        headers.get("x-ms-continuation"),
+                        epk_range_,
+                    ):
+                        yield resp
+                return
+            except Resp401:
+                raise
+            except Exception:
+                if retries < max_retries:
+                    retries += 1
+                    continue
+                raise
+            self.sessions.update(resp.headers.get("x-ms-session-token"))
+            # a page cut short by the budget says nothing about the best size
+            if page_max == sized:
+                self._observe_page(
+                    max_item,
+                    pk_id,
+                    resp,
+                    len(resp.content),
+                    time.perf_counter() - start,
+                )
+            if budget is not None:
+                budget.spend(resp)
+            yield resp
+            if "x-ms-continuation" not in resp.headers:
+                return
+            retries = 0
+            page += 1
+            headers = {
+                **headers,
+                "x-ms-continuation": resp.headers["x-ms-continuation"],
+            }
+            if (session := self.sessions.get(pk_id)) is not None:
+                headers["x-ms-session-token"] = session
+
+    async def query_pages(
+        self,
+        query: str,
+        *,
+        params: list[dict[str, str]] | None = None,
+        partition_key: PartitionKey | None = None,
+        max_item: int | str | None = None,
+        max_retries: int | None = None,
+        pk_id: str | list[str] | None = None,
+        limit: int | None = None,
+    ) -> AsyncGenerator[httpx.Response, None]:
+        """
+        Perform query and yield response pages from every pk range as they arrive.
+
+        The pk ranges are read concurrently and each one only requests its next
+        continuation page once the previous page has been consumed.
+
+        Args:
+            query (str): SQL query
+            params (List[Dict[str, str]], optional): Params for query or None.
+            partition_key (str, optional): The partition key. If none then cross
+            partition is enabled.
+            max_item (int | str, optional): Max items per request.
+            max_retries: The max_retries per page
+            pk_id (str | list[str], optional): pk range(s) to query, all if None.
+            limit (int, optional): Stop once this many documents have been
+            received. Page requests ask only for what is still needed and
+            outstanding requests are cancelled once it is reached. The last page
+            can still hold more than needed when ranges were fetched at once.
+
+        Returns
+        -------
+            AsyncGenerator[httpx.Response]: Response pages in arrival order
+        """
+        pk_ids, epk_ranges = await self._targets(partition_key, pk_id)
+        budget = RowBudget(limit) if limit is not None else None
+        received = 0
+        if limit is not None and limit <= 0:
+            return
+        pages = interleave(
+            [
+                self._query_pages(
+                    query,
+                    params,
+                    partition_key,
+                    max_item,
+                    pk_id_,
+                    max_retries,
+                    budget,
+                    epk_range=epk_ranges.get(pk_id_),  # type: ignore
+                )
+                for pk_id_ in pk_ids
+            ]
+        )
+        try:
+            async for resp in pages:
+                yield resp
+                received += int(resp.headers.get("x-ms-item-count", 0))
+                if limit is not None and received >= limit:
+                    return
+        finally:
+            await pages.aclose()
+
+    def _prep_query(
+        self,
+        query: str,
+        params: list[dict[str, str]] | None = None,
+        partition_key: PartitionKey | None = None,
+        max_item: int | str | None = None,
+        pk_id: int | str | None = None,
+        continuation: str | None = None,
+    ):
+        if params is None:
+            params = []
+        body = {"query": query, "parameters": params}
+        # resource_link = f"dbs/{self.db}/colls/{self.container}"
+
+        headers = self._make_headers(
+            is_query=True,
+            resource_type="docs",
+            max_item=max_item,
+            partition_key=partition_key,
+            pk_id=pk_id,
+        )
+        if continuation is not None:
+            headers["x-ms-continuation"] = continuation
+
+        url = self.base_url + f"//dbs/{self.db}/colls/{self.container}/docs"
+        return (params, body, headers, url)
+
+    async def query_stream(
+        self,
+        query: str,
+        params: list[dict[str, str]] | None = None,
+        partition_key: PartitionKey | None = None,
+        max_item: int | str | None = None,
+        limit: int | None = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Perform query and return all results as a generator.
+
+        Args:
+            query (str): SQL query
+            params (List[Dict[str, str]], optional): Params for query or None.
+            partition_key (str, optional): The partition key. If none then cross
             partition is enabled.
             return_as: The return type either dict, pl, raw, resp
             max_item (int | str, optional): Max items per request.
             max_retries: The max_retries for Auth
+            limit (int, optional): Stop after this many documents. Each page
+            asks only for what is still needed and no continuation is requested
+            once it is reached.
 
         Returns
         -------
             bytes: Generator response
         """
+        if self._is_prefix(
+            self.partition_key if partition_key is None else partition_key
+        ):
+            msg = (
+                "query_stream needs a full partition key, use query_pages for a prefix"
+            )
+            raise ValueError(msg)
         params, body, headers, url = self._prep_query(
             query,
             params,
             partition_key,
             max_item,
         )
+        budget = RowBudget(limit) if limit is not None else None
         first_stream = True
+        page = 0
         while True:
             first_chunk = True
             prev_chunk = None
-            async with self.client.stream(
-                "POST", url, json=body, headers=headers
-            ) as resp:
-                if resp.status_code != 200:
-                    msg = f"Status code = {resp.status_code}"
-                    raise RespFail(msg)
-                if "x-ms-session-token" in resp.headers:
-                    self.session = resp.headers.get("x-ms-session-token")
-                if "x-ms-continuation" in resp.headers:
-                    headers = {
-                        **headers,
-                        "x-ms-continuation": resp.headers.get("x-ms-continuation"),
-                        "x-ms-session-token": resp.headers.get("x-ms-session-token"),
-                    }
-                    last_stream = False
-                else:
-                    last_stream = True
-                async for chunk in resp.aiter_bytes():
-                    if first_chunk is True and first_stream is True:
-                        prev_chunk = get_inner_content(chunk, first_chunk, False)
-                        first_chunk = False
-                    elif first_chunk is True and first_stream is False:
-                        prev_chunk = get_inner_content(chunk, first_chunk, False)[1:]
-                        first_chunk = False
+            page_max = sized = self._page_size(max_item)
+            if budget is not None:
+                page_max = budget.page_size(page_max)
+            if page_max is not None:
+                headers["x-ms-max-item-count"] = str(page_max)
+            page_bytes = 0
+            start = time.perf_counter()
+            span = None
+            timer = RequestTimer()
+            extensions = {}
+            if self.tracer is not None:
+                span = self._request_span("POST", url, headers, 0, page)
+                extensions["trace"] = timer.atrace
+            try:
+                async with self.client.stream(
+                    "POST", url, json=body, headers=headers, extensions=extensions
+                ) as resp:
+                    if resp.status_code != 200:
+                        msg = f"Status code = {resp.status_code}"
+                        raise RespFail(msg)  # noqa: TRY301
+                    self.sessions.update(resp.headers.get("x-ms-session-token"))
+                    if "x-ms-continuation" in resp.headers:
+                        headers = {
+                            **headers,
+                            "x-ms-continuation": resp.headers.get("x-ms-continuation"),
+                        }
+                        last_stream = False
                     else:
-                        assert prev_chunk is not None
-                        yield prev_chunk
+                        last_stream = True
+                    if budget is not None:
+                        budget.spend(resp)
+                        if budget.remaining <= 0:
+                            last_stream = True
+                    async for chunk in resp.aiter_bytes():
+                        page_bytes += len(chunk)
+                        if first_chunk is True and first_stream is True:
+                            prev_chunk = get_inner_content(chunk, first_chunk, False)
+                            first_chunk = False
+                        elif first_chunk is True and first_stream is False:
+                            inner = get_inner_content(chunk, first_chunk, False)
+                            prev_chunk = inner[1:]
+                            first_chunk = False
+                        else:
+                            assert prev_chunk is not None
+                            yield prev_chunk
+                            await asyncio.sleep(0)
+                            prev_chunk = chunk
+                    first_stream = False
+                    page += 1
+                    if span is not None:
+                        self._end_request_span(span, resp, timer, page_bytes)
+                        span = None
+                    if page_max == sized:
+                        self._observe_page(
+                            max_item,
+                            None,
+                            resp,
+                            page_bytes,
+                            time.perf_counter() - start,
+                        )
+                    assert prev_chunk is not None
+                    if last_stream is True:
+                        yield get_inner_content(prev_chunk, False, True)
                         await asyncio.sleep(0)
-                        prev_chunk = chunk
-                first_stream = False
-                assert prev_chunk is not None
-                if last_stream is True:
-                    yield get_inner_content(prev_chunk, False, True)
-                    await asyncio.sleep(0)
-                    break
-                else:
-                    yield get_inner_content(prev_chunk, False, True)[:-1] + b","
-                    await asyncio.sleep(0)
+                        break
+                    else:
+                        yield get_inner_content(prev_chunk, False, True)[:-1] + b","
+                        await asyncio.sleep(0)
+            except BaseException as err:
+                # the span is ended once its page is read, a consumer closing
+                # the stream mid-page isn't an error
+                if span is not None:
+                    if not isinstance(err, GeneratorExit):
+                        span.record_exception(err)
+                    span.end()
+                raise
+
+    async def _send_read(
+        self, method: str, url: str, attempt: int = 0, page: int = 0, **kwargs
+    ) -> httpx.Response:
+        """Send a read, through the region router when regional reads are on."""
+        if self.tracer is not None:
+            return await self._traced_request(
+                self._route_read, method, url, attempt, page, **kwargs
+            )
+        return await self._route_read(method, url, **kwargs)
+
+    async def _route_read(self, method: str, url: str, **kwargs) -> httpx.Response:
+        if self.regions is None:
+            return await self.client.request(method, url, **kwargs)
+        if not self.regions.discovered:
+            await self.regions.discover(
+                self.client, self._make_headers(resource_type="")
+            )
+        path = url[len(self.base_url) :]
+        return await self.regions.send(
+            lambda endpoint: self.client.request(method, endpoint + path, **kwargs)
+        )
+
+    async def export_query(
+        self,
+        query: str,
+        path: str | Path,
+        *,
+        format: EXPORT_FORMATS = "parquet",
+        params: list[dict[str, Any]] | None = None,
+        partition_key: PartitionKey | None = None,
+        partition_by: str | None = None,
+        schema: dict[str, plt.DataType] | None = None,
+        rows_per_file: int = 100_000,
+        max_item: int | str | None = None,
+        max_retries: int | None = None,
+        pk_id: str | list[str] | None = None,
+        checkpoint: str | Path | None = None,
+    ) -> Path:
+        """
+        Stream query results to Parquet, Arrow IPC or NDJSON files.
+
+        Pages from every pk range are written as they arrive, so memory is
+        bounded by `rows_per_file` rather than the size of the result. Parquet
+        and IPC exports are a directory of part files that can be read back
+        with `pl.scan_parquet(path)` or `pl.scan_ipc(path / "**" / "*.arrow")`.
+        NDJSON is a single file unless split with `partition_by`.
+
+        Progress (the continuation token of each pk range) is checkpointed after
+        every file written. Calling again with the same arguments after an
+        interruption resumes from the checkpoint instead of starting over. The
+        checkpoint is removed when the export completes.
+
+        Args:
+            query (str): SQL query
+            path (str | Path): Output file (NDJSON) or directory.
+            format (str): parquet, ipc or ndjson
+            params (List[Dict[str, Any]], optional): Params for query or None.
+            partition_key (str, optional): The partition key. If none then cross
+            partition is enabled.
+            partition_by (str, optional): Split output hive style into
+            `partition_by=value` directories, typically the partition key.
+            schema (dict[str, pl.DataType], optional): Cast every part to this
+            schema so parts are consistent. Parquet and IPC only.
+            rows_per_file (int): Rows buffered before a file is written.
+            max_item (int | str, optional): Max items per request.
+            max_retries: The max_retries per page
+            pk_id (str | list[str], optional): pk range(s) to query, all if None.
+            checkpoint (str | Path, optional): Checkpoint file, defaults to
+            `path` with a .checkpoint suffix.
+
+        Returns
+        -------
+            Path: The output path
+        """
+        return await export_query(
+            self,
+            query,
+            path,
+            format=format,
+            params=params,
+            partition_key=partition_key,
+            partition_by=partition_by,
+            schema=schema,
+            rows_per_file=rows_per_file,
+            max_item=max_item,
+            max_retries=max_retries,
+            pk_id=pk_id,
+            checkpoint=checkpoint,
+        )
+
+    async def scan_container(
+        self,
+        handler: Callable[[Any], Any],
+        *,
+        query: str = "select * from c",
+        params: list[dict[str, Any]] | None = None,
+        return_as: ALLOWED_RETURNS = "dict",
+        workers: int = 16,
+        splits_per_range: int | None = None,
+        max_item: int | str | None = None,
+        max_retries: int | None = None,
+        checkpoint: str | Path | None = None,
+        checkpoint_interval: float = 1.0,
+    ) -> int:
+        """
+        Read a whole container in parallel, resumably.
+
+        Every pk range is split into `splits_per_range` sub-ranges of effective
+        partition key, so parallelism isn't capped by the number of physical
+        partitions. `workers` sub-ranges are read at a time and each page is
+        passed to `handler`. A sync handler runs in a thread so slow or
+        blocking handlers don't stall the event loop and the other workers'
+        requests, an async one is awaited.
+
+        With `checkpoint`, the continuation token of every sub-range is saved
+        at most every `checkpoint_interval` seconds and when the scan stops.
+        Only pages the handler returned from are recorded, so after a failure
+        calling again with the same arguments resumes without skipping
+        documents, though pages in flight at the failure are handled again.
+        The checkpoint is removed when the scan completes.
+
+        Args:
+            handler (Callable): Called with each page as return_as.
+            query (str): SQL query run against every sub-range.
+            params (List[Dict[str, Any]], optional): Params for query or None.
+            return_as: The page type either dict, pl, raw, resp, json
+            workers (int): Sub-ranges read concurrently.
+            splits_per_range (int, optional): Sub-ranges per pk range, by
+            default enough to give every worker one.
+            max_item (int | str, optional): Max items per request.
+            max_retries: The max_retries per page
+            checkpoint (str | Path, optional): Checkpoint file.
+            checkpoint_interval (float): Least seconds between checkpoint saves.
+
+        Returns
+        -------
+            int: Number of documents scanned, including before a resume
+        """
+        return await scan_container(
+            self,
+            handler,
+            query=query,
+            params=params,
+            return_as=return_as,
+            workers=workers,
+            splits_per_range=splits_per_range,
+            max_item=max_item,
+            max_retries=max_retries,
+            checkpoint=checkpoint,
+            checkpoint_interval=checkpoint_interval,
+        )
 
-    async def _get_resp(self, url, *, json, headers):
-        resp = await self.client.post(url, json=json, headers=headers)
+    async def _get_resp(self, url, *, json, headers, attempt=0, page=0):
+        resp = await self._send_read(
+            "POST", url, json=json, headers=headers, attempt=attempt, page=page
+        )
         if resp.status_code == 401:
             msg = resp.text
             raise Resp401(msg)
+        elif resp.status_code == 410:
+            msg = resp.text
+            raise PartitionKeyRangeGone(msg)
         elif resp.status_code != 200:
             msg = resp.text
             raise RespFail(msg)
         assert isinstance(resp, httpx.Response)
         return resp
 
+    def _get_resp_sync(
+        self, client: httpx.Client, url, *, json, headers, attempt=0, page=0
+    ):
+        if self.tracer is None:
+            resp = client.post(url, json=json, headers=headers)
+        else:
+            timer = RequestTimer()
+            span = self._request_span("POST", url, headers, attempt, page)
+            try:
+                resp = client.post(
+                    url, json=json, headers=headers, extensions={"trace": timer}
+                )
+            except BaseException as err:
+                span.record_exception(err)
+                span.end()
+                raise
+            self._end_request_span(span, resp, timer)
+        if resp.status_code == 401:
+            msg = resp.text
+            raise Resp401(msg)
+        elif resp.status_code == 410:
+            msg = resp.text
+            raise PartitionKeyRangeGone(msg)
+        elif resp.status_code != 200:
+            msg = resp.text
+            raise RespFail(msg)
+        return resp
+
     async def _get_stream(self, url, *, json, headers, continued=0):
         async with self.client.stream("POST", url, json=json, headers=headers) as resp:
-            if "x-ms-session-token" in resp.headers:
-                self.session = resp.headers.get("x-ms-session-token")
+            self.sessions.update(resp.headers.get("x-ms-session-token"))
             if "x-ms-continuation" in resp.headers:
                 new_headers = {
                     **headers,
                     "x-ms-continuation": resp.headers.get("x-ms-continuation"),
-                    "x-ms-session-token": resp.headers.get("x-ms-session-token"),
                 }
                 next_page = asyncio.create_task(
                     self._get_stream(
@@ -703,8 +1928,6 @@ class Cosmos:
                 )
             else:
                 next_page = None
-            if "x-ms-session-token" in resp.headers:
-                self.session = resp.headers["x-ms-session-token"]
             resp_bytes = []
             async for chunk in resp.aiter_bytes():
                 resp_bytes.append(chunk)
@@ -720,13 +1943,20 @@ class Cosmos:
             return b"".join(resp_bytes)
 
     async def _create_or_upsert(
-        self, record, is_upsert=False, retries=0, max_retries=None
+        self, record, is_upsert=False, retries=0, max_retries=None, partition_key=None
     ):
+        # record can also be an already serialized json body with its partition_key
         if max_retries is None:
             max_retries = self.max_retries
         url = self.base_url + f"//dbs/{self.db}/colls/{self.container}/docs"
-        if self.partition_key_name in record:
-            partition_key = record[self.partition_key_name]
+        if partition_key is not None:
+            pass
+        elif (
+            not isinstance(record, bytes)
+            and (values := partition_key_of(record, self.partition_key_paths))
+            is not None
+        ):
+            partition_key = values
         elif self.partition_key is not None:
             partition_key = self.partition_key
         else:
@@ -734,21 +1964,33 @@ class Cosmos:
         headers = self._make_headers(
             resource_type="docs", is_upsert=is_upsert, partition_key=partition_key
         )
+        if isinstance(record, bytes):
+            headers["Content-Type"] = "application/json"
+            body = {"content": record}
+        else:
+            body = {"json": record}
         try:
-            resp = await self.client.post(url, json=record, headers=headers)
+            if self.tracer is None:
+                resp = await self.client.post(url, headers=headers, **body)
+            else:
+                resp = await self._traced_request(
+                    self.client.request, "POST", url, retries, headers=headers, **body
+                )
             resp.raise_for_status()
-            if "x-ms-session-token" in resp.headers:
-                self.session = resp.headers["x-ms-session-token"]
+            self.sessions.update(resp.headers.get("x-ms-session-token"))
 
         except Resp401:
             raise
         except Exception:
             if retries < max_retries:
                 return await self._create_or_upsert(
-                    record, is_upsert, retries + 1, max_retries
+                    record, is_upsert, retries + 1, max_retries, partition_key
                 )
             else:
                 raise
+        finally:
+            # also after failures, the write may have been applied regardless
+            self._invalidate_cache(partition_key)
         return resp
 
     async def create(self, record: dict | list):
@@ -777,10 +2019,91 @@ class Cosmos:
         """
         return await self._create_or_upsert(record, is_upsert=True)
 
+    async def upsert_df(
+        self,
+        df: plt.DataFrame,
+        *,
+        concurrency: int = 32,
+        chunk_rows: int = 10_000,
+    ) -> int:
+        """
+        Upsert every row of a polars DataFrame.
+
+        Rows are serialized to json by polars in bulk and split into one body
+        per document, so no Python dicts are built. The partition key is taken
+        from the partition key column, or the default partition key if the
+        frame doesn't have one.
+
+        Args:
+            df (pl.DataFrame): Rows to upsert, with an id column.
+            concurrency (int): Max requests in flight.
+            chunk_rows (int): Rows serialized at a time.
+
+        Returns
+        -------
+            int: Number of documents upserted
+        """
+        paths = self._bulk_key_paths(df.columns)
+        return await send_bodies(
+            iter_document_bodies(df, paths, chunk_rows),
+            self._upsert_body,
+            concurrency,
+        )
+
+    async def import_parquet(
+        self,
+        path: str | Path,
+        *,
+        concurrency: int = 32,
+        chunk_rows: int = 10_000,
+    ) -> int:
+        """
+        Upsert every row of a Parquet file (or glob of files).
+
+        The file is read once by a streaming scan, `chunk_rows` at a time, so
+        it never has to fit in memory, and every chunk feeds the same pool of
+        requests so it stays busy across chunk boundaries. See `upsert_df`.
+
+        Args:
+            path (str | Path): Parquet file or glob.
+            concurrency (int): Max requests in flight.
+            chunk_rows (int): Rows read and serialized at a time.
+
+        Returns
+        -------
+            int: Number of documents upserted
+        """
+        if pl is None:
+            msg = "can't use import_parquet without polars installed"
+            raise ValueError(msg)
+        lf = pl.scan_parquet(path)
+        paths = self._bulk_key_paths(lf.collect_schema().names())
+        return await send_bodies(
+            (
+                body
+                for batch in iter_batches(lf, chunk_rows)
+                for body in iter_document_bodies(batch, paths, chunk_rows)
+            ),
+            self._upsert_body,
+            concurrency,
+        )
+
+    def _bulk_key_paths(self, columns: list[str]) -> list[str]:
+        """Partition key columns of a bulk upsert, checking there is a key."""
+        paths = getattr(self, "partition_key_paths", [])
+        if not set(paths).issubset(columns) and self.partition_key is None:
+            raise MustSpecifyPartitionKey
+        return paths
+
+    async def _upsert_body(self, body: bytes, partition_key: PartitionKey | None):
+        return await self._create_or_upsert(
+            body, is_upsert=True, partition_key=partition_key
+        )
+
     async def delete(
         self,
         id: str,
-        partition_key: str | None = None,
+        partition_key: PartitionKey | None = None,
         retries: int = 0,
         max_retries: int | None = None,
     ):
@@ -797,10 +2120,14 @@ class Cosmos:
 
         url = f"{self.base_url}/dbs/{self.db}/colls/{self.container}/docs/{quote_plus(id)}"
         try:
-            resp = await self.client.delete(url, headers=headers)
+            if self.tracer is None:
+                resp = await self.client.delete(url, headers=headers)
+            else:
+                resp = await self._traced_request(
+                    self.client.request, "DELETE", url, retries, headers=headers
+                )
             resp.raise_for_status()
-            if "x-ms-session-token" in resp.headers:
-                self.session = resp.headers["x-ms-session-token"]
+            self.sessions.update(resp.headers.get("x-ms-session-token"))
 
         except Resp401:
             raise
@@ -808,6 +2135,10 @@ class Cosmos:
             if retries < max_retries - 1:
                 return await self.delete(id, partition_key, retries + 1, max_retries)
             raise
+        finally:
+            self._invalidate_cache(
+                self.partition_key if partition_key is None else partition_key
+            )
         return resp.content
 
     @overload
@@ -815,18 +2146,18 @@ class Cosmos:
         self,
         id: str,
         *,
-        partition_key: str,
+        partition_key: PartitionKey,
         return_as: Literal["dict"],
     ) -> dict[str, Any]: ...
     @overload
-    async def read(self, id: str, *, partition_key: str) -> dict[str, Any]: ...
+    async def read(self, id: str, *, partition_key: PartitionKey) -> dict[str, Any]: ...
 
     @overload
     async def read(
         self,
         id: str,
         *,
-        partition_key: str,
+        partition_key: PartitionKey,
         return_as: Literal["pl", "pljson"],
     ) -> plt.DataFrame: ...
 
@@ -835,15 +2166,15 @@ class Cosmos:
         self,
         id: str,
         *,
-        partition_key: str,
-        return_as: Literal["raw"],
+        partition_key: PartitionKey,
+        return_as: Literal["raw", "json"],
     ) -> str: ...
 
     async def read(
         self,
         id: str,
         *,
-        partition_key: str,
+        partition_key: PartitionKey,
         return_as: ALLOWED_RETURNS = "dict",
         max_retries: int = 5,
     ):
@@ -854,14 +2185,38 @@ class Cosmos:
             id (str): The id to be read
             partition_key (str): The partition from which the id comes
             return_as: The return type either dict, pl, raw, resp
+
+        With coalesce_reads, identical concurrent reads share one request and
+        decode the response separately.
         """
-        resp = await self._read(id, partition_key, retries=0, max_retries=max_retries)
-        return self._apply_return_as(resp, return_as)
+        if self.single_flight is None:
+            fetch = self._read(id, partition_key, retries=0, max_retries=max_retries)
+        else:
+            fetch = self.single_flight.do(
+                ("read", self._coalesce_scope(partition_key), id),
+                lambda: self._read(
+                    id, partition_key, retries=0, max_retries=max_retries
+                ),
+            )
+        result = self._read_as(fetch, return_as)
+        if self.tracer is not None:
+            result = self._traced_operation(
+                "cosmos.read",
+                {"cosmos.id": id, **self._partition_key_attribute(partition_key)},
+                result,
+            )
+        return await result
+
+    async def _read_as(
+        self, fetch: Awaitable[httpx.Response], return_as: ALLOWED_RETURNS
+    ):
+        # decoding is part of the read so its span is under the read's
+        return self._apply_return_as(await fetch, return_as)
 
     async def _read(
         self,
         id: str,
-        partition_key: str | None = None,
+        partition_key: PartitionKey | None = None,
         retries: int = 0,
         max_retries: int = 5,
     ):
@@ -872,7 +2227,7 @@ class Cosmos:
 
         url = f"{self.base_url}/dbs/{self.db}/colls/{self.container}/docs/{quote_plus(id)}"
         try:
-            resp = await self.client.get(url, headers=headers)
+            resp = await self._send_read("GET", url, headers=headers, attempt=retries)
             resp.raise_for_status()
         except Resp401:
             raise
@@ -885,6 +2240,23 @@ class Cosmos:
         return resp
 
     def _apply_return_as(self, resp: httpx.Response, return_as: ALLOWED_RETURNS):
+        if self.tracer is None or return_as == "resp":
+            return self._convert(resp, return_as)
+        span = start_span(
+            self.tracer,
+            "cosmos.decode",
+            {
+                "cosmos.return_as": return_as,
+                "cosmos.pages": 1,
+                "cosmos.response_bytes": len(resp.content),
+            },
+        )
+        try:
+            return self._convert(resp, return_as)
+        finally:
+            span.end()
+
+    def _convert(self, resp: httpx.Response, return_as: ALLOWED_RETURNS):
         if return_as == "resp":
             return resp
         elif return_as == "dict":
@@ -892,6 +2264,8 @@ class Cosmos:
         elif return_as in ["pljson", "pl"]:
             assert pl is not None
             return pl.read_json(resp.content)
+        elif return_as in ["raw", "json"]:
+            return resp.content
 
     @overload
     async def get_container_meta(
@@ -922,17 +2296,216 @@ class Cosmos:
         resp = await self.client.get(url, headers=headers)
         return self._apply_return_as(resp, return_as)
 
-    def _get_container_meta_sync(self, return_as: ALLOWED_RETURNS = "dict", retries=0):
+    async def _post_script(
+        self,
+        url: str,
+        *,
+        json: Any,
+        headers: dict[str, str],
+        max_retries: int | None = None,
+    ) -> httpx.Response:
+        if max_retries is None:
+            max_retries = self.max_retries
+        retries = 0
+        while True:
+            try:
+                if self.tracer is None:
+                    resp = await self.client.post(url, json=json, headers=headers)
+                else:
+                    resp = await self._traced_request(
+                        self.client.request,
+                        "POST",
+                        url,
+                        retries,
+                        json=json,
+                        headers=headers,
+                    )
+                resp.raise_for_status()
+            except httpx.HTTPStatusError as err:
+                if err.response.status_code == 401:
+                    raise Resp401(err.response.text) from err
+                # a script that failed for any other reason fails again
+                if (
+                    err.response.status_code not in _TRANSIENT_STATUS
+                    or retries >= max_retries
+                ):
+                    raise RespFail(err.response.text) from err
+            except httpx.TransportError:
+                if retries >= max_retries:
+                    raise
+            else:
+                self.sessions.update(resp.headers.get("x-ms-session-token"))
+                return resp
+            retries += 1
+
+    async def _upsert_script(
+        self, kind: SCRIPT_TYPES, body: dict[str, str]
+    ) -> dict[str, Any]:
+        url = f"{self.base_url}/dbs/{self.db}/colls/{self.container}/{kind}"
+        headers = self._make_headers(resource_type=kind, is_upsert=True)
+        # scripts belong to the container, not to a partition
+        headers.pop("x-ms-documentdb-partitionkey", None)
+        resp = await self._post_script(url, json=body, headers=headers)
+        return orjson.loads(resp.content)
+
+    async def upsert_sproc(self, sproc_id: str, body: str) -> dict[str, Any]:
+        """
+        Create or replace a stored procedure.
+
+        Args:
+            sproc_id (str): Name of the stored procedure.
+            body (str): Its JavaScript source, e.g. "function (x) {...}".
+
+        Returns
+        -------
+            dict[str, Any]: The stored procedure resource
+        """
+        return await self._upsert_script("sprocs", {"id": sproc_id, "body": body})
+
+    async def upsert_udf(self, udf_id: str, body: str) -> dict[str, Any]:
+        """
+        Create or replace a user defined function.
+
+        Queries call it as udf.<udf_id>(...).
+
+        Args:
+            udf_id (str): Name of the function.
+            body (str): Its JavaScript source.
+
+        Returns
+        -------
+            dict[str, Any]: The udf resource
+        """
+        return await self._upsert_script("udfs", {"id": udf_id, "body": body})
+
+    async def upsert_trigger(
+        self,
+        trigger_id: str,
+        body: str,
+        *,
+        trigger_type: Literal["Pre", "Post"] = "Pre",
+        trigger_operation: Literal["All", "Create", "Replace", "Delete"] = "All",
+    ) -> dict[str, Any]:
+        """
+        Create or replace a trigger.
+
+        Args:
+            trigger_id (str): Name of the trigger.
+            body (str): Its JavaScript source.
+            trigger_type (str): Run before (Pre) or after (Post) the operation.
+            trigger_operation (str): Operations the trigger can be used with.
+
+        Returns
+        -------
+            dict[str, Any]: The trigger resource
+        """
+        return await self._upsert_script(
+            "triggers",
+            {
+                "id": trigger_id,
+                "body": body,
+                "triggerType": trigger_type,
+                "triggerOperation": trigger_operation,
+            },
+        )
+
+    async def execute_sproc(
+        self,
+        sproc_id: str,
+        params: list[Any] | None = None,
+        *,
+        partition_key: PartitionKey | None = None,
+        return_as: ALLOWED_RETURNS = "dict",
+        continuation_key: str | None = None,
+        max_retries: int | None = None,
+    ):
+        """
+        Execute a stored procedure in one partition.
+
+        Stored procedures are bounded in time so bulk ones usually return
+        before finishing with a flag saying there is more to do. With
+        `continuation_key` the procedure is executed again for as long as
+        that key of its result is truthy. When the value isn't a bool it is
+        taken to be a token to resume from and is passed to the next execution
+        as its last parameter, in place of the previous token.
+
+        Args:
+            sproc_id (str): Name of the stored procedure.
+            params (list, optional): Its arguments.
+            partition_key (str, optional): The partition to run in, defaults to
+            the default partition key.
+            return_as: The return type either dict, pl, raw, resp, json
+            continuation_key (str, optional): Key of the result saying whether
+            there is more work remaining.
+            max_retries: The max_retries per execution
+
+        Returns
+        -------
+            The procedure's result, or one result per execution in a list (a
+            DataFrame for pl, a json array for json) with continuation_key
+        """
+        if return_as in ["pl", "pljson"] and pl is None:
+            msg = f"can't use return_as={return_as} without polars installed"
+            raise ValueError(msg)
+        if partition_key is None:
+            partition_key = self.partition_key
+        if partition_key is None:
+            raise MustSpecifyPartitionKey
+        url = (
+            f"{self.base_url}/dbs/{self.db}/colls/{self.container}"
+            f"/sprocs/{quote(sproc_id, safe='')}"
+        )
+        params = [] if params is None else list(params)
+        resumed = False
+        pages: list[httpx.Response] = []
+        while True:
+            headers = self._make_headers(
+                resource_type="sprocs", partition_key=partition_key
+            )
+            try:
+                resp = await self._post_script(
+                    url, json=params, headers=headers, max_retries=max_retries
+                )
+            finally:
+                # stored procedures can write anywhere in their partition
+                self._invalidate_cache(partition_key)
+            if continuation_key is None:
+                return self._apply_return_as(resp, return_as)
+            pages.append(resp)
+            result = orjson.loads(resp.content)
+            more = result.get(continuation_key) if isinstance(result, dict) else None
+            if not more:
+                break
+            if not isinstance(more, bool):
+                params = [*params[:-1], more] if resumed else [*params, more]
+                resumed = True
+        if return_as == "resp":
+            return pages
+        if return_as == "raw":
+            return [resp.content for resp in pages]
+        if return_as == "json":
+            return b"[" + b",".join(resp.content for resp in pages) + b"]"
+        if return_as == "dict":
+            return [orjson.loads(resp.content) for resp in pages]
+        assert pl is not None
+        return pl.concat(
+            [pl.read_json(resp.content) for resp in pages], how="diagonal_relaxed"
+        )
+
+    def _sync_client(self) -> httpx.Client:
         assert self.client.auth is not None
         assert hasattr(self.client.auth, "master_key")
 
         master_key: str = self.client.auth.master_key  # type: ignore
+        return httpx.Client(auth=CosAuth(master_key))
+
+    def _get_container_meta_sync(self, return_as: ALLOWED_RETURNS = "dict", retries=0):
+        sync_client = self._sync_client()
         try:
-            sync_client = httpx.Client(auth=CosAuth(master_key))
             url = f"{self.base_url}/dbs/{self.db}/colls/{self.container}"
             headers = self._make_headers(resource_type="colls")
             resp = sync_client.get(url, headers=headers)
-            return self._apply_return_as(resp, return_as)
+            return self._convert(resp, return_as)
         except Exception:
             time.sleep(1)
             if retries < 5:
@@ -940,6 +2513,114 @@ class Cosmos:
                     return_as=return_as, retries=retries + 1
                 )
 
+    def _get_pk_ranges_sync(self, client: httpx.Client) -> list[dict[str, Any]]:
+        url = f"{self.base_url}/dbs/{self.db}/colls/{self.container}/pkranges"
+        headers = self._make_headers(resource_type="pkranges")
+        resp = client.get(url, headers=headers)
+        resp.raise_for_status()
+        return orjson.loads(resp.content)["PartitionKeyRanges"]
+
+    def _query_pages_sync(
+        self,
+        client: httpx.Client,
+        query: str,
+        params: list[dict[str, Any]] | None = None,
+        partition_key: PartitionKey | None = None,
+        max_item: int | str | None = None,
+        pk_id: str | int | None = None,
+        max_retries: int | None = None,
+        epk_range: tuple[str, str] | None = None,
+        continuation: str | None = None,
+    ) -> Iterator[httpx.Response]:
+        """
+        Perform query synchronously, yielding one response per page.
+
+        Meant for callers that can't await, such as polars IO plugins. Pages are
+        requested lazily so a consumer that stops iterating stops the query.
+
+        Args:
+            client (httpx.Client): Sync client from `_sync_client`
+            query (str): SQL query
+            params (List[Dict[str, Any]], optional): Params for query or None.
+            partition_key (str, optional): The partition key.
+            max_item (int | str, optional): Max items per request.
+            pk_id (str | int, optional): The pk range id to query.
+            max_retries: The max_retries per page
+            epk_range (tuple[str, str], optional): Limit the query to this
+            effective partition key range of pk_id.
+            continuation (str, optional): Resume from this continuation token.
+
+        Returns
+        -------
+            Iterator[httpx.Response]: One response per continuation page
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        params, body, headers, url = self._prep_query(
+            query, params, partition_key, max_item, pk_id, continuation
+        )
+        if epk_range is not None:
+            self._set_epk_range(headers, epk_range)
+        retries = 0
+        page = 0
+        while True:
+            if (page_max := self._page_size(max_item, pk_id)) is not None:
+                headers["x-ms-max-item-count"] = str(page_max)
+            try:
+                start = time.perf_counter()
+                resp = self._get_resp_sync(
+                    client,
+                    url,
+                    json=body,
+                    headers=headers,
+                    attempt=retries,
+                    page=page,
+                )
+            except PartitionKeyRangeGone:
+                if pk_id is None:
+                    raise
+                # read on from the ranges that replaced the split or merged one
+                known = epk_range or self._range_bounds.get(str(pk_id))
+                pk_ranges = self._get_pk_ranges_sync(client)
+                self._route(None, pk_ranges)
+                if known is None:
+                    raise
+                for pk_id_, epk_range_ in overlapping_ranges(pk_ranges, known).items():
+                    yield from self._query_pages_sync(
+                        client,
+                        query,
+                        params,
+                        partition_key,
+                        max_item,
+                        pk_id_,
+                        max_retries,
+                        epk_range_,
+                        headers.get("x-ms-continuation"),
+                    )
+                return
+            except Resp401:
+                raise
+            except Exception:
+                if retries < max_retries:
+                    retries += 1
+                    continue
+                raise
+            self.sessions.update(resp.headers.get("x-ms-session-token"))
+            self._observe_page(
+                max_item, pk_id, resp, len(resp.content), time.perf_counter() - start
+            )
+            yield resp
+            if "x-ms-continuation" not in resp.headers:
+                return
+            retries = 0
+            page += 1
+            headers = {
+                **headers,
+                "x-ms-continuation": resp.headers["x-ms-continuation"],
+            }
+            if (session := self.sessions.get(pk_id)) is not None:
+                headers["x-ms-session-token"] = session
+
     @overload
     async def get_pk_ranges(self, return_as: Literal["dict"]) -> dict[str, Any]: ...
     @overload
@@ -959,10 +2640,179 @@ class Cosmos:
         -------
             _type_: _description_
         """
+        resp = await self._fetch_pk_ranges()
+        return self._apply_return_as(resp, cast(ALLOWED_RETURNS, return_as))
+
+    async def _fetch_pk_ranges(self, *, refresh: bool = False) -> httpx.Response:
+        if self.account is not None:
+            return await self.account.get_pk_ranges(
+                self.db, self.container, refresh=refresh
+            )
         url = f"{self.base_url}/dbs/{self.db}/colls/{self.container}/pkranges"
         headers = self._make_headers(resource_type="pkranges")
-        resp = await self.client.get(url, headers=headers)
-        return self._apply_return_as(resp, cast(ALLOWED_RETURNS, return_as))
+        return await self.client.get(url, headers=headers)
+
+
+class CosmosAccount:
+    """
+    One Cosmos account shared by any number of container handles.
+
+    Owns a single HTTP/2 connection pool, auth signer and region router, and
+    caches container metadata and pk ranges, so handles for many containers
+    share connections and each container's metadata is only fetched once.
+    Handles of the same container also share session tokens and in-flight
+    reads. Cached pk ranges are fetched again when a request finds its range
+    was split or merged.
+    """
+
+    def __init__(
+        self,
+        conn_str: str | None = None,
+        *,
+        max_connections: int | None = 100,
+        max_keepalive_connections: int | None = 20,
+        keepalive_expiry: float | None = 30.0,
+        timeout: float | None = 5.0,
+        http2: bool = True,
+        preferred_locations: list[str] | None = None,
+        hedge_reads: bool = False,
+        pk_range_ttl: float = 300.0,
+    ):
+        """
+        Connect to a Cosmos account.
+
+        Args:
+            conn_str (str, optional): Connection string, defaults to the cosmos
+            environment variable.
+            max_connections (int, optional): Most connections open at once.
+            max_keepalive_connections (int, optional): Most idle connections
+            kept open for reuse.
+            keepalive_expiry (float, optional): Seconds an idle connection is
+            kept open.
+            timeout (float, optional): Seconds before a request times out.
+            http2 (bool): Use HTTP/2, which multiplexes requests over fewer
+            connections.
+            preferred_locations (list[str], optional): Regions to read from,
+            shared by every handle. See `Cosmos`.
+            hedge_reads (bool): Send hedged reads. See `Cosmos`.
+            pk_range_ttl (float): Seconds the pk ranges of a container are
+            cached before being fetched again.
+        """
+        if conn_str is None and "cosmos" in os.environ:
+            conn_str = os.environ["cosmos"]  # noqa: SIM112
+        assert conn_str is not None
+        self.base_url, key = parse_conn_str(conn_str)
+        self.auth = CosAuth(key)
+        self.client = httpx.AsyncClient(
+            auth=self.auth,
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        )
+        self.regions: RegionRouter | None = None
+        if preferred_locations is not None or hedge_reads:
+            self.regions = RegionRouter(
+                self.base_url, preferred_locations, hedge=hedge_reads
+            )
+        self.pk_range_ttl = pk_range_ttl
+        self.container_meta: dict[tuple[str, str], dict[str, Any]] = {}
+        self._pk_ranges: dict[tuple[str, str], tuple[float, httpx.Response]] = {}
+        self._fetches = SingleFlight()
+        self._states: dict[tuple[str, str], tuple[SessionTokens, SingleFlight]] = {}
+
+    async def container(self, db: str, container: str, **kwargs) -> Cosmos:
+        """
+        Get a handle for a container.
+
+        Handles are cheap: the first one for a container fetches its metadata,
+        later ones make no requests.
+
+        Args:
+            db (str): Database name
+            container (str): Container name
+            **kwargs: Other `Cosmos` arguments, e.g. default_partition_key.
+
+        Returns
+        -------
+            Cosmos: The container handle
+        """
+        await self.get_container_meta(db, container)
+        return Cosmos(db, container, account=self, **kwargs)
+
+    def _container_state(
+        self, db: str, container: str
+    ) -> tuple[SessionTokens, SingleFlight]:
+        """Session tokens and in-flight reads shared by a container's handles."""
+        key = (db, container)
+        if key not in self._states:
+            self._states[key] = (SessionTokens(), SingleFlight())
+        return self._states[key]
+
+    async def _get(self, path: str, resource_type: RESOURCE_TYPES) -> httpx.Response:
+        resp = await self.client.get(
+            self.base_url + path, headers=_base_headers(resource_type)
+        )
+        if resp.status_code == 401:
+            raise Resp401(resp.text)
+        if resp.status_code != 200:
+            raise RespFail(resp.text)
+        return resp
+
+    async def get_container_meta(self, db: str, container: str) -> dict[str, Any]:
+        """Metadata of a container, fetched once."""
+        key = (db, container)
+        if key not in self.container_meta:
+            resp = await self._fetches.do(
+                ("colls", key),
+                lambda: self._get(f"/dbs/{db}/colls/{container}", "colls"),
+            )
+            self.container_meta[key] = orjson.loads(resp.content)
+        return self.container_meta[key]
+
+    async def get_pk_ranges(
+        self, db: str, container: str, *, refresh: bool = False
+    ) -> httpx.Response:
+        """
+        The pk ranges response of a container, cached for pk_range_ttl seconds.
+
+        Args:
+            db (str): Database name
+            container (str): Container name
+            refresh (bool): Fetch again even if cached, e.g. after a split.
+
+        Returns
+        -------
+            httpx.Response: The pkranges response
+        """
+        key = (db, container)
+        cached = self._pk_ranges.get(key)
+        if not refresh and cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        resp = await self._fetches.do(
+            ("pkranges", key),
+            lambda: self._get(f"/dbs/{db}/colls/{container}/pkranges", "pkranges"),
+        )
+        self._pk_ranges[key] = (time.monotonic() + self.pk_range_ttl, resp)
+        return resp
+
+    def clear_cache(self):
+        """Forget cached metadata and pk ranges."""
+        self.container_meta = {}
+        self._pk_ranges = {}
+
+    async def aclose(self):
+        """Close the connection pool."""
+        await self.client.aclose()
+
+    async def __aenter__(self) -> CosmosAccount:
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
 
 
 class CosmosLog(logging.Handler):
@@ -973,7 +2823,7 @@ class CosmosLog(logging.Handler):
         db: str,
         container: str,
         conn_str: str | None = None,
-        default_partition_key: str | None = None,
+        default_partition_key: PartitionKey | None = None,
         global_client: str | None = None,
         max_retries: int = 5,
     ):
@@ -1008,7 +2858,7 @@ def cosmos_logger(
     db: str,
     container: str,
     conn_str: str | None = None,
-    default_partition_key: str | None = None,
+    default_partition_key: PartitionKey | None = None,
     global_client: str | None = None,
     max_retries: int = 5,
     logger_level: int | None = None,
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import io
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable, Iterator
+
+import orjson
+
+if TYPE_CHECKING:
+    import polars as plt
+
+    from cosmospl.partition import PartitionKey
+
+
+def iter_document_bodies(
+    df: plt.DataFrame,
+    partition_key_names: list[str],
+    chunk_rows: int = 10_000,
+) -> Iterator[tuple[bytes, PartitionKey | None]]:
+    """
+    Serialize a DataFrame into one json body per row.
+
+    Each chunk of rows is written by polars as NDJSON in one go and the buffer
+    is split on newlines, so no Python dict is ever built for a row.
+
+    Args:
+        df (pl.DataFrame): Rows to serialize. Needs an id column.
+        partition_key_names (list[str]): Columns holding the partition key, one
+        per level of a hierarchical key.
+        chunk_rows (int): Rows serialized at a time.
+
+    Returns
+    -------
+        Iterator[tuple[bytes, PartitionKey | None]]: json body and the list of
+        partition key values per row, None when the frame doesn't have the key
+        columns
+    """
+    import polars as pl
+
+    if "id" not in df.columns:
+        msg = "DataFrame needs an id column"
+        raise ValueError(msg)
+    if df.schema["id"] != pl.String:
+        # Cosmos only accepts string ids
+        df = df.with_columns(pl.col("id").cast(pl.String))
+    has_key = len(partition_key_names) > 0 and set(partition_key_names).issubset(
+        df.columns
+    )
+    # values of other dtypes (dates, decimals, ...) are written as strings, the
+    # key is read back from json so it matches the body
+    plain_key = has_key and all(
+        dtype.is_integer()
+        or dtype.is_float()
+        or dtype in (pl.String, pl.Boolean, pl.Null)
+        for dtype in (df.schema[x] for x in partition_key_names)
+    )
+    for chunk in df.iter_slices(n_rows=chunk_rows):
+        buffer = io.BytesIO()
+        chunk.write_ndjson(buffer)
+        bodies = buffer.getvalue().split(b"\n")
+        if not has_key:
+            keys: list[Any] = [None] * chunk.height
+        elif plain_key:
+            # a list even for single path keys, so a null value is the key
+            # [null] rather than no key
+            keys = [
+                list(x)
+                for x in zip(*(chunk.get_column(x) for x in partition_key_names))
+            ]
+        else:
+            buffer = io.BytesIO()
+            chunk.select(partition_key_names).write_ndjson(buffer)
+            keys = [
+                [row[x] for x in partition_key_names]
+                for row in map(orjson.loads, buffer.getvalue().splitlines())
+            ]
+        yield from zip(bodies, keys)
+
+
+def iter_batches(
+    lf: plt.LazyFrame, chunk_rows: int = 10_000
+) -> Iterator[plt.DataFrame]:
+    """
+    Frames of about `chunk_rows` rows from a single streaming run of `lf`.
+
+    Args:
+        lf (pl.LazyFrame): The scan to read.
+        chunk_rows (int): Rows per frame.
+
+    Returns
+    -------
+        Iterator[pl.DataFrame]: The rows of `lf` in order
+    """
+    import polars as pl
+
+    if hasattr(lf, "collect_batches"):
+        yield from lf.collect_batches(chunk_size=chunk_rows, lazy=True)
+        return
+    # polars without collect_batches, every slice is a separate scan
+    rows = lf.select(pl.len()).collect().item()
+    for offset in range(0, rows, chunk_rows):
+        yield lf.slice(offset, chunk_rows).collect()
+
+
+async def send_bodies(
+    bodies: Iterable[tuple[bytes, PartitionKey | None]],
+    send: Callable[[bytes, PartitionKey | None], Awaitable[object]],
+    concurrency: int = 32,
+) -> int:
+    """
+    Send bodies with at most `concurrency` requests in flight.
+
+    Bodies are pulled lazily so only `concurrency` of them are in memory beyond
+    the current chunk. The first failure cancels the remaining workers.
+
+    Args:
+        bodies (Iterable[tuple[bytes, PartitionKey | None]]): json body and
+        partition key.
+        send (Callable): Sends one body.
+        concurrency (int): Max requests in flight.
+
+    Returns
+    -------
+        int: Number of bodies sent
+    """
+    iterator = iter(bodies)
+    sent = 0
+
+    async def worker():
+        nonlocal sent
+        for body, partition_key in iterator:
+            await send(body, partition_key)
+            sent += 1
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    return sent
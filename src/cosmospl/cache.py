@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Sequence
+
+import orjson
+
+# Rough bytes an entry costs besides its content
+_ENTRY_OVERHEAD = 200
+
+
+class _Entry:
+    __slots__ = ("container", "content", "expires", "scope")
+
+    def __init__(
+        self,
+        content: bytes,
+        container: Hashable,
+        scope: list[Any] | None,
+        expires: float | None,
+    ):
+        self.content = content
+        self.container = container
+        self.scope = scope
+        self.expires = expires
+
+
+class QueryCache:
+    """
+    LRU cache of query results, bounded by size and age.
+
+    Results are kept as a single json array of their documents, the most
+    compact form every return mode can be decoded from. Writes made through a
+    `Cosmos` using the cache drop the results they could change: those of
+    queries in the written partition, in a prefix of it for hierarchical keys,
+    and every cross partition query of the container. Writes made any other
+    way aren't seen, `ttl` bounds how stale such results get.
+
+    One cache can be shared by several `Cosmos` instances, results are kept
+    per container.
+
+    Args:
+        max_bytes (int): Most bytes of results kept, least recently used are
+        dropped first.
+        ttl (float, optional): Seconds a result is kept. None keeps results
+        until they're evicted or invalidated.
+    """
+
+    def __init__(self, max_bytes: int = 64_000_000, ttl: float | None = 60.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._generations: dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> bytes | None:
+        """The cached result for `key`, None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires is not None:
+            if entry.expires <= time.monotonic():
+                self._drop(key)
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.content
+
+    def generation(self, container: Hashable) -> int:
+        """Count of invalidations of `container`, taken before running a query."""
+        return self._generations.get(container, 0)
+
+    def put(
+        self,
+        key: Hashable,
+        content: bytes,
+        container: Hashable,
+        scope: Sequence[Any] | None,
+        generation: int,
+    ):
+        """
+        Keep a query result.
+
+        Args:
+            key (Hashable): Identifies the query.
+            content (bytes): json array of the result's documents.
+            container (Hashable): The container queried.
+            scope (Sequence, optional): Partition key values the query was
+            limited to, None for cross partition queries.
+            generation (int): `generation(container)` from before the query
+            was sent. If a write invalidated the container since, the result
+            may predate it and isn't kept.
+        """
+        if generation != self.generation(container):
+            return
+        size = len(content) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self._entries[key] = _Entry(
+            content, container, None if scope is None else list(scope), expires
+        )
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, container: Hashable, partition_key: Sequence[Any] | None):
+        """
+        Drop the results a write to `partition_key` of `container` can change.
+
+        Args:
+            container (Hashable): The container written to.
+            partition_key (Sequence, optional): Values of the written
+            document's partition key. None drops every result of the container.
+        """
+        self._generations[container] = self.generation(container) + 1
+        written = None if partition_key is None else list(partition_key)
+        stale = [
+            key
+            for key, entry in self._entries.items()
+            if entry.container == container
+            and (
+                entry.scope is None
+                or written is None
+                # compared as json so 1 and True are different keys, as in Cosmos
+                or orjson.dumps(entry.scope)
+                == orjson.dumps(written[: len(entry.scope)])
+            )
+        ]
+        for key in stale:
+            self._drop(key)
+
+    def clear(self):
+        """Drop every result."""
+        self._entries.clear()
+        self.nbytes = 0
+
+    def _drop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= len(entry.content) + _ENTRY_OVERHEAD
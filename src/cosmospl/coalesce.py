@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Shares one in-flight call between identical concurrent requests.
+
+    The first request for a key starts the call, requests for the same key
+    made before it finishes await that same call. Once it finishes the key is
+    forgotten, so later requests make a fresh call and failures aren't cached.
+    A waiter being cancelled doesn't cancel the call for the others, the call
+    is only cancelled when every waiter has gone.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await the in-flight call for `key`, starting it with `call` if none.
+
+        Args:
+            key (Hashable): Identifies the request.
+            call (Callable[[], Awaitable]): Makes the request.
+
+        Returns
+        -------
+            Any: The result of the shared call
+        """
+        entry = self._calls.get(key)
+        if entry is None:
+            entry = _Call(asyncio.ensure_future(call()))
+            self._calls[key] = entry
+            entry.task.add_done_callback(lambda _: self._forget(key, entry))
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.task.done():
+                entry.task.cancel()
+                self._forget(key, entry)
+
+    def _forget(self, key: Hashable, entry: _Call):
+        if self._calls.get(key) is entry:
+            del self._calls[key]
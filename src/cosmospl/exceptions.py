@@ -22,3 +22,7 @@ class UnsupportedPartitionKey(UserWarning):
 
 class MustSpecifyPartitionKey(Exception):
     """Must Specify a Partition Key or have defaults set."""
+
+
+class PartitionKeyRangeGone(RespFail):
+    """A pk range was split or merged since the pk ranges were fetched (410)."""
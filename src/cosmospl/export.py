@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Literal, TypeAlias
+from urllib.parse import quote
+
+import orjson
+
+from cosmospl.merge import interleave
+
+if TYPE_CHECKING:
+    import httpx
+    import polars as plt
+
+    from cosmospl import Cosmos
+
+EXPORT_FORMATS: TypeAlias = Literal["parquet", "ipc", "ndjson"]
+_EXTENSIONS = {"parquet": "parquet", "ipc": "arrow", "ndjson": "ndjson"}
+_PART = re.compile(r"^part-(\d+)\.\w+(\.tmp)?$")
+_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+class _Export:
+    """
+    Writes query pages to disk as they arrive and checkpoints progress.
+
+    Parquet and IPC exports are a directory of part files, each holding up to
+    `rows_per_file` rows, optionally split hive style into `column=value`
+    directories. A file is written under a temporary name and renamed once
+    complete, then the checkpoint records the continuation token of every pk
+    range and how many parts exist. An interrupted export resumes by removing
+    anything written after the last checkpoint and continuing each range from
+    its token. NDJSON without a split is a single file that is truncated back
+    to the checkpointed size instead.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        checkpoint: Path,
+        state: dict[str, Any],
+        schema: dict[str, plt.DataType] | None = None,
+    ):
+        self.path = path
+        self.checkpoint = checkpoint
+        self.state = state
+        self.schema = schema
+        self.format: EXPORT_FORMATS = state["format"]
+        self.partition_by: str | None = state["partition_by"]
+        self.extension = _EXTENSIONS[self.format]
+        self.single_file = self.format == "ndjson" and self.partition_by is None
+
+    def discard_partial(self):
+        """Remove output written after the last checkpoint."""
+        if self.single_file:
+            if self.path.exists():
+                with self.path.open("r+b") as f:
+                    f.truncate(self.state["offset"])
+            return
+        for file in self.path.rglob("part-*"):
+            match = _PART.match(file.name)
+            if match is not None and (
+                match.group(2) is not None or int(match.group(1)) >= self.state["parts"]
+            ):
+                file.unlink()
+
+    def save(self):
+        tmp = self.checkpoint.with_name(self.checkpoint.name + ".tmp")
+        tmp.write_bytes(orjson.dumps(self.state))
+        tmp.replace(self.checkpoint)
+
+    def write(
+        self,
+        pages: list[bytes],
+        ranges: dict[str, str | None],
+        done: list[str],
+    ):
+        """Write buffered pages then checkpoint the progress they represent."""
+        if self.format == "ndjson":
+            self._write_ndjson(pages)
+        else:
+            self._write_frame(pages)
+        self.state["parts"] += 1
+        self.state["ranges"] = dict(ranges)
+        self.state["done"] = list(done)
+        self.save()
+
+    def _part_path(self, key: Any = None) -> Path:
+        directory = self.path
+        if self.partition_by is not None:
+            value = _NULL_PARTITION if key is None else quote(str(key), safe="")
+            directory = directory / f"{self.partition_by}={value}"
+            directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"part-{self.state['parts']:05d}.{self.extension}"
+
+    def _write_ndjson(self, pages: list[bytes]):
+        groups: dict[Any, list[bytes]] = {}
+        for page in pages:
+            for doc in orjson.loads(page)["Documents"]:
+                key = doc.get(self.partition_by) if self.partition_by else None
+                groups.setdefault(key, []).append(
+                    orjson.dumps(doc, option=orjson.OPT_APPEND_NEWLINE)
+                )
+        if self.single_file:
+            with self.path.open("ab") as f:
+                for lines in groups.values():
+                    f.write(b"".join(lines))
+                self.state["offset"] = f.tell()
+            return
+        for key, lines in groups.items():
+            _write_atomic(self._part_path(key), lambda f, x=lines: f.write(b"".join(x)))
+
+    def _write_frame(self, pages: list[bytes]):
+        import polars as pl
+
+        from cosmospl import documents_span
+
+        frames = []
+        for page in pages:
+            start, end = documents_span(page)
+            if end - start > 2:
+                frames.append(pl.read_json(page[start:end]))
+        if len(frames) == 0:
+            return
+        df = pl.concat(frames, how="diagonal_relaxed")
+        if self.schema is not None:
+            df = df.select(
+                pl.col(name).cast(dtype, strict=False)
+                if name in df.columns
+                else pl.lit(None, dtype).alias(name)
+                for name, dtype in self.schema.items()
+            )
+
+        def write(frame: plt.DataFrame, file: Path):
+            if self.format == "parquet":
+                _write_atomic(file, frame.write_parquet)
+            else:
+                _write_atomic(file, frame.write_ipc)
+
+        if self.partition_by is None:
+            write(df, self._part_path())
+            return
+        for key, part in df.partition_by(
+            self.partition_by, as_dict=True, include_key=False
+        ).items():
+            write(part, self._part_path(key[0]))
+
+
+def _write_atomic(file: Path, writer):
+    tmp = file.with_name(file.name + ".tmp")
+    with tmp.open("wb") as f:
+        writer(f)
+    tmp.replace(file)
+
+
+async def export_query(
+    cosdb: Cosmos,
+    query: str,
+    path: str | Path,
+    *,
+    format: EXPORT_FORMATS = "parquet",
+    params: list[dict[str, Any]] | None = None,
+    partition_key: str | None = None,
+    partition_by: str | None = None,
+    schema: dict[str, plt.DataType] | None = None,
+    rows_per_file: int = 100_000,
+    max_item: int | str | None = None,
+    max_retries: int | None = None,
+    pk_id: str | list[str] | None = None,
+    checkpoint: str | Path | None = None,
+) -> Path:
+    """
+    Stream query results to files with bounded memory, resumably.
+
+    See `Cosmos.export_query`.
+    """
+    if format not in _EXTENSIONS:
+        msg = f"format must be one of {list(_EXTENSIONS)}"
+        raise ValueError(msg)
+    if format != "ndjson":
+        try:
+            import polars  # noqa: F401
+        except ModuleNotFoundError:
+            msg = f"can't export to {format} without polars installed"
+            raise ValueError(msg) from None
+    path = Path(path)
+    checkpoint_path = (
+        Path(checkpoint)
+        if checkpoint is not None
+        else path.with_name(path.name + ".checkpoint")
+    )
+    if checkpoint_path.exists():
+        state = orjson.loads(checkpoint_path.read_bytes())
+        expected = {
+            "query": query,
+            "params": params,
+            "format": format,
+            "partition_by": partition_by,
+        }
+        if any(state[key] != value for key, value in expected.items()):
+            msg = f"{checkpoint_path} is the checkpoint of a different export"
+            raise ValueError(msg)
+        export = _Export(path, checkpoint_path, state, schema)
+        export.discard_partial()
+    else:
+        if path.exists():
+            msg = f"{path} already exists"
+            raise FileExistsError(msg)
+        pk_ids, epk_ranges = await cosdb._targets(partition_key, pk_id)
+        state = {
+            "query": query,
+            "params": params,
+            "format": format,
+            "partition_by": partition_by,
+            "parts": 0,
+            "offset": 0,
+            # "" stands for a query routed by partition key rather than pk range
+            "ranges": {("" if x is None else str(x)): None for x in pk_ids},
+            # part of each range holding a hierarchical key prefix
+            "epk_ranges": epk_ranges,
+            "done": [],
+        }
+        export = _Export(path, checkpoint_path, state, schema)
+        if not export.single_file:
+            path.mkdir(parents=True)
+        export.save()
+
+    ranges: dict[str, str | None] = dict(state["ranges"])
+    epk_ranges = state.get("epk_ranges", {})
+    done: list[str] = list(state["done"])
+
+    async def pages(range_id: str) -> AsyncGenerator[tuple[str, httpx.Response], None]:
+        async for resp in cosdb._query_pages(
+            query,
+            params,
+            partition_key,
+            max_item,
+            range_id or None,
+            max_retries,
+            continuation=ranges[range_id],
+            epk_range=tuple(epk_ranges[range_id]) if range_id in epk_ranges else None,
+        ):
+            yield (range_id, resp)
+
+    buffer: list[bytes] = []
+    rows = 0
+    stream = interleave([pages(x) for x in ranges if x not in done])
+    try:
+        async for range_id, resp in stream:
+            buffer.append(resp.content)
+            rows += int(resp.headers.get("x-ms-item-count", 0))
+            if "x-ms-continuation" in resp.headers:
+                ranges[range_id] = resp.headers["x-ms-continuation"]
+            else:
+                done.append(range_id)
+            if rows >= rows_per_file:
+                await asyncio.to_thread(export.write, buffer, ranges, done)
+                buffer = []
+                rows = 0
+        if len(buffer) > 0:
+            await asyncio.to_thread(export.write, buffer, ranges, done)
+    finally:
+        await stream.aclose()
+    with contextlib.suppress(FileNotFoundError):
+        checkpoint_path.unlink()
+    return path
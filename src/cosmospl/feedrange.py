@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import inspect
+import math
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, cast
+
+import orjson
+
+if TYPE_CHECKING:
+    from cosmospl import ALLOWED_RETURNS, Cosmos
+
+# Shortest effective partition key width, in hex digits, used for splitting
+_EPK_DIGITS = 32
+
+
+def split_epk_range(min_inclusive: str, max_exclusive: str, parts: int) -> list[str]:
+    """
+    Split an effective partition key range into `parts` equal sub-ranges.
+
+    Effective partition keys are hex strings compared as numbers once padded
+    on the right, "" being the lowest and "FF" the highest of the container.
+
+    Args:
+        min_inclusive (str): Lower bound of the range.
+        max_exclusive (str): Upper bound of the range.
+        parts (int): Number of sub-ranges.
+
+    Returns
+    -------
+        list[str]: parts + 1 boundaries, starting with min_inclusive and ending
+        with max_exclusive
+    """
+    digits = max(_EPK_DIGITS, len(min_inclusive), len(max_exclusive))
+    low = int(min_inclusive.ljust(digits, "0") or "0", 16)
+    high = int(max_exclusive.ljust(digits, "0"), 16)
+    parts = max(1, min(parts, high - low))
+    step = (high - low) // parts
+    inner = [f"{low + step * i:0{digits}X}" for i in range(1, parts)]
+    return [min_inclusive, *inner, max_exclusive]
+
+
+class _Checkpoint:
+    """
+    Continuation state of every sub-range of a scan, saved atomically.
+
+    Only state the handler has finished with is recorded, so a resumed scan
+    never skips documents, though it can repeat the pages in flight when the
+    scan stopped.
+    """
+
+    def __init__(self, path: Path | None, state: dict[str, Any], interval: float):
+        self.path = path
+        self.state = state
+        self.interval = interval
+        self._saved = time.monotonic()
+
+    def save(self, *, force: bool = False):
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._saved < self.interval:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_bytes(orjson.dumps(self.state))
+        tmp.replace(self.path)
+        self._saved = now
+
+
+async def scan_container(
+    cosdb: Cosmos,
+    handler: Callable[[Any], Any],
+    *,
+    query: str = "select * from c",
+    params: list[dict[str, Any]] | None = None,
+    return_as: ALLOWED_RETURNS = "dict",
+    workers: int = 16,
+    splits_per_range: int | None = None,
+    max_item: int | str | None = None,
+    max_retries: int | None = None,
+    checkpoint: str | Path | None = None,
+    checkpoint_interval: float = 1.0,
+) -> int:
+    """
+    Read a whole container in parallel over effective partition key sub-ranges.
+
+    See `Cosmos.scan_container`.
+    """
+    checkpoint_path = None if checkpoint is None else Path(checkpoint)
+    if checkpoint_path is not None and checkpoint_path.exists():
+        state = orjson.loads(checkpoint_path.read_bytes())
+        if state["query"] != query or state["params"] != params:
+            msg = f"{checkpoint_path} is the checkpoint of a different scan"
+            raise ValueError(msg)
+    else:
+        pk_ranges = await cosdb._pk_range_list()
+        if splits_per_range is None:
+            splits_per_range = math.ceil(workers / len(pk_ranges))
+        sub_ranges = []
+        for pk_range in pk_ranges:
+            bounds = split_epk_range(
+                pk_range["minInclusive"], pk_range["maxExclusive"], splits_per_range
+            )
+            sub_ranges.extend(
+                {
+                    "pk_id": str(pk_range["id"]),
+                    "min": low,
+                    "max": high,
+                    "continuation": None,
+                    "done": False,
+                }
+                for low, high in zip(bounds[:-1], bounds[1:])
+            )
+        state = {"query": query, "params": params, "rows": 0, "ranges": sub_ranges}
+    progress = _Checkpoint(checkpoint_path, state, checkpoint_interval)
+    progress.save(force=True)
+
+    is_async = inspect.iscoroutinefunction(handler)
+    todo: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+    for sub_range in state["ranges"]:
+        if not sub_range["done"]:
+            todo.put_nowait(sub_range)
+
+    async def worker():
+        while not todo.empty():
+            sub_range = todo.get_nowait()
+            pages = cosdb._query_pages(
+                query,
+                params,
+                None,
+                max_item,
+                sub_range["pk_id"],
+                max_retries,
+                continuation=sub_range["continuation"],
+                epk_range=(sub_range["min"], sub_range["max"]),
+            )
+            try:
+                async for resp in pages:
+                    page = cosdb._decode_pages([resp], return_as)
+                    if return_as in ["raw", "resp"]:
+                        page = cast(list, page)[0]
+                    if is_async:
+                        await handler(page)
+                    else:
+                        await asyncio.to_thread(handler, page)
+                    state["rows"] += int(resp.headers.get("x-ms-item-count", 0))
+                    sub_range["continuation"] = resp.headers.get("x-ms-continuation")
+                    sub_range["done"] = sub_range["continuation"] is None
+                    progress.save()
+            finally:
+                await pages.aclose()
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(max(1, workers))]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        progress.save(force=True)
+    if checkpoint_path is not None:
+        with contextlib.suppress(FileNotFoundError):
+            checkpoint_path.unlink()
+    return state["rows"]
@@ -0,0 +1,604 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import re
+from typing import TYPE_CHECKING, Any, AsyncGenerator, AsyncIterator
+
+import orjson
+
+if TYPE_CHECKING:
+    import httpx
+
+# keywords, not property names like c.from
+_CLAUSES = re.compile(
+    r"(?<![.\w])(FROM|WHERE|GROUP\s+BY|ORDER\s+BY|OFFSET)\b", flags=re.IGNORECASE
+)
+_OPENERS = {"(": ")", "[": "]", "{": "}"}
+_AGGREGATE = re.compile(
+    r"^(COUNT|SUM|MIN|MAX|AVG)\s*\((.*)\)$", flags=re.IGNORECASE | re.DOTALL
+)
+_TRAILING_NAME = re.compile(r"\s+([A-Za-z_]\w*)$")
+# words that end an expression or join it to the next, so can't be aliases
+_NOT_ALIASES = {"TRUE", "FALSE", "NULL", "UNDEFINED", "ASC", "DESC"}
+_OPERATOR_WORDS = {"AND", "OR", "NOT", "IN", "BETWEEN", "LIKE", "ESCAPE", "VALUE"}
+_OPERATOR_CHARS = set("+-*/%|&^=<>!?:,.")
+_PATH = re.compile(r'^[A-Za-z_]\w*(?:\.[A-Za-z_]\w*|\[\s*"[^"]*"\s*\])+$')
+_LAST_PROPERTY = re.compile(r'(?:\.([A-Za-z_]\w*)|\[\s*"([^"]*)"\s*\])$')
+_COUNT_NUMBERS = "SUM(IS_NUMBER({0}) ? 1 : 0)"
+
+
+def _mask(text: str) -> str:
+    """
+    Blank out string literals and anything nested in brackets.
+
+    The result has the same length as `text` so positions found in it can be
+    used to slice `text`. Only top level SQL is left visible.
+    """
+    out = []
+    closers: list[str] = []
+    quote = None
+    for char in text:
+        if quote is not None:
+            out.append(" ")
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+            out.append(" ")
+        elif char in _OPENERS:
+            out.append(" " if closers else char)
+            closers.append(_OPENERS[char])
+        elif closers and char == closers[-1]:
+            closers.pop()
+            out.append(" " if closers else char)
+        else:
+            out.append(" " if closers else char)
+    return "".join(out)
+
+
+def _split_top_level(text: str) -> list[str]:
+    masked = _mask(text)
+    parts = []
+    start = 0
+    for i, char in enumerate(masked):
+        if char == ",":
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return [x for x in parts if x != ""]
+
+
+def _resolve_int(token: str, params: list[dict[str, Any]] | None) -> int | None:
+    if token.isdigit():
+        return int(token)
+    for param in params or []:
+        if param.get("name") == token and isinstance(param.get("value"), int):
+            return param["value"]
+    return None
+
+
+def _split_alias(item: str) -> tuple[str, str | None]:
+    """Split a select item into its expression and alias, with or without AS."""
+    masked = _mask(item)
+    match = _TRAILING_NAME.search(item)
+    # a name inside a string literal or brackets is blanked in `masked`
+    if match is None or masked[match.start(1) :] != match.group(1):
+        return (item, None)
+    name = match.group(1)
+    expr = item[: match.start()].rstrip()
+    words = masked[: match.start()].split()
+    last_word = words[-1].upper() if len(words) > 0 else ""
+    if last_word == "AS":
+        expr = expr[: -len("AS")].rstrip()
+    elif (
+        expr == ""
+        or name.upper() in _NOT_ALIASES
+        or last_word in _OPERATOR_WORDS
+        or expr[-1] in _OPERATOR_CHARS
+    ):
+        return (item, None)
+    return (expr, name)
+
+
+def _aggregate(expr: str) -> re.Match | None:
+    """Match an item that is a single aggregate call, like MAX(c.a)."""
+    match = _AGGREGATE.match(expr.strip())
+    if match is None:
+        return None
+    masked = _mask(expr.strip())
+    # the call's parenthesis has to be the one closing the item, which rules
+    # out expressions of aggregates like MAX(c.a) - MIN(c.a)
+    if ")" in masked[masked.index("(") + 1 : -1]:
+        return None
+    return match
+
+
+def _output_name(expr: str, unnamed: int) -> str:
+    if _PATH.match(expr) is not None:
+        last = _LAST_PROPERTY.search(expr)
+        assert last is not None
+        return last.group(1) if last.group(1) is not None else last.group(2)
+    return f"${unnamed}"
+
+
+class QueryPlan:
+    """
+    How the per pk range results of a query have to be merged client side.
+
+    Cosmos only executes ORDER BY, TOP, OFFSET LIMIT and aggregates within a
+    single pk range, so a cross partition query gets one partial answer per
+    range. `query` is the rewritten query to send to each range and `merge`
+    combines what comes back into the answer a single range container would
+    have given.
+    """
+
+    def __init__(
+        self,
+        query: str,
+        *,
+        top: int | None = None,
+        offset: int = 0,
+        limit: int | None = None,
+        descending: list[bool] | None = None,
+        aggregates: list[tuple[str, str, str]] | None = None,
+        value_aggregate: bool = False,
+    ):
+        self.query = query
+        self.top = top
+        self.offset = offset
+        self.limit = limit
+        self.descending = descending
+        self.aggregates = aggregates
+        self.value_aggregate = value_aggregate
+
+    def take(self, limit: int | None = None) -> int | None:
+        """Max number of documents the merged result can have."""
+        caps = [x for x in (self.top, self.limit, limit) if x is not None]
+        return min(caps) if len(caps) > 0 else None
+
+    def budgets(self, ranges: int, limit: int | None = None) -> list[RowBudget | None]:
+        """
+        Row budgets for the page requests of each pk range.
+
+        An ordered merge may need all of its rows from any one range, so each
+        range gets its own budget. Otherwise rows from any range count towards
+        the same total and the ranges share one budget.
+
+        Args:
+            ranges (int): Number of pk ranges.
+            limit (int, optional): Caller's global row limit.
+
+        Returns
+        -------
+            list[RowBudget | None]: One entry per pk range
+        """
+        take = self.take(limit)
+        if self.aggregates is not None or take is None:
+            return [None] * ranges
+        if self.descending is not None:
+            return [RowBudget(take + self.offset) for _ in range(ranges)]
+        return [RowBudget(take + self.offset)] * ranges
+
+    async def merge(
+        self, iterators: list[AsyncIterator[Any]], limit: int | None = None
+    ) -> list[Any]:
+        """
+        Merge the documents of each pk range into the final result.
+
+        Args:
+            iterators (list[AsyncIterator]): Documents of each pk range.
+            limit (int, optional): Stop after this many documents.
+
+        Returns
+        -------
+            list[Any]: The merged documents
+        """
+        if self.aggregates is not None:
+            partials = await asyncio.gather(*[_collect(x) for x in iterators])
+            return self._merge_aggregates([y for x in partials for y in x])
+        take = self.take(limit)
+        if self.descending is not None:
+            merged = merge_ordered(iterators, self.descending)
+            try:
+                docs: list[Any] = []
+                if take is not None and take <= 0:
+                    return docs
+                skip = self.offset
+                async for doc in merged:
+                    if "p" not in doc:
+                        continue
+                    if skip > 0:
+                        skip -= 1
+                        continue
+                    docs.append(doc["p"])
+                    if take is not None and len(docs) >= take:
+                        break
+                return docs
+            finally:
+                await merged.aclose()
+        wanted = None if take is None else take + self.offset
+        docs = await collect_unordered(iterators, wanted)
+        return docs[self.offset :]
+
+    def _merge_aggregates(self, partials: list[Any]) -> list[Any]:
+        assert self.aggregates is not None
+        merged = {}
+        partials = [x for x in partials if isinstance(x, dict)]
+        for part, name, func in self.aggregates:
+            if func == "AVG":
+                total = _combine("SUM", [x.get(f"{part}s") for x in partials])
+                count = _combine("SUM", [x.get(f"{part}n") for x in partials])
+                value = None if total is None or not count else total / count
+            else:
+                value = _combine(func, [x.get(part) for x in partials])
+            if value is not None:
+                merged[name] = value
+        if self.value_aggregate:
+            return list(merged.values())
+        return [merged]
+
+
+class RowBudget:
+    """
+    Rows a query still needs, shared by the page requests drawing on it.
+
+    Page requests ask for no more than what is left, which keeps the last
+    pages small, and a continuation chain stops once nothing is left.
+    """
+
+    def __init__(self, limit: int):
+        self.remaining = limit
+
+    def page_size(self, max_item: int | str | None = None) -> int:
+        """Items to ask for in the next page given the caller's max_item."""
+        if max_item is None or int(max_item) <= 0:
+            return self.remaining
+        return min(int(max_item), self.remaining)
+
+    def spend(self, resp: httpx.Response):
+        """Count the items of a received page against the budget."""
+        self.remaining -= int(resp.headers.get("x-ms-item-count", 0))
+
+
+def _combine(func: str, values: list[Any]) -> Any:
+    values = [x for x in values if x is not None]
+    if func == "COUNT":
+        return sum(values)
+    if len(values) == 0:
+        return None
+    if func == "SUM":
+        return sum(values)
+    if func == "MIN":
+        return min(values, key=_rank)
+    return max(values, key=_rank)
+
+
+def plan_query(
+    query: str, params: list[dict[str, Any]] | None = None
+) -> QueryPlan | None:
+    """
+    Work out how to merge a query's per pk range results with light SQL analysis.
+
+    Handles ORDER BY, TOP, OFFSET LIMIT and aggregates without GROUP BY.
+    Queries that need no merging, or that are too complex to analyze (DISTINCT,
+    GROUP BY, parameterized TOP without a value), return None and are run as is.
+
+    Args:
+        query (str): SQL query
+        params (List[Dict[str, Any]], optional): Params for query or None.
+
+    Returns
+    -------
+        QueryPlan | None: The plan or None when simple concatenation is correct
+    """
+    masked = _mask(query)
+    select = re.match(r"\s*SELECT\s+", query, flags=re.IGNORECASE)
+    if select is None:
+        return None
+    clauses: dict[str, int] = {}
+    for match in _CLAUSES.finditer(masked, select.end()):
+        clauses.setdefault(re.sub(r"\s+", " ", match.group(1).upper()), match.start())
+    if "FROM" not in clauses or "GROUP BY" in clauses:
+        return None
+    projection = query[select.end() : clauses["FROM"]].strip()
+    if re.match(r"DISTINCT\b", projection, flags=re.IGNORECASE):
+        return None
+    top = None
+    top_text = ""
+    if (match := re.match(r"TOP\s+(\d+|@\w+)\s+", projection, flags=re.I)) is not None:
+        top = _resolve_int(match.group(1), params)
+        if top is None:
+            return None
+        top_text = match.group(0)
+        projection = projection[match.end() :]
+    value = re.match(r"VALUE\s+", projection, flags=re.IGNORECASE)
+    if value is not None:
+        projection = projection[value.end() :].strip()
+
+    ends = sorted(clauses.values()) + [len(query)]
+
+    def clause(name: str) -> str | None:
+        if name not in clauses:
+            return None
+        start = clauses[name]
+        return query[start : ends[ends.index(start) + 1]]
+
+    offset = 0
+    limit = None
+    offset_text = clause("OFFSET")
+    if offset_text is not None:
+        match = re.match(
+            r"OFFSET\s+(\d+|@\w+)\s+LIMIT\s+(\d+|@\w+)\s*$",
+            offset_text.strip(),
+            flags=re.IGNORECASE,
+        )
+        if match is None:
+            return None
+        offset_ = _resolve_int(match.group(1), params)
+        limit = _resolve_int(match.group(2), params)
+        if offset_ is None or limit is None:
+            return None
+        offset = offset_
+    body = query[clauses["FROM"] : clauses.get("ORDER BY", clauses.get("OFFSET"))]
+    # each range returns up to offset + limit rows, the offset is applied when
+    # merging
+    suffix = "" if offset_text is None else f" OFFSET 0 LIMIT {offset + limit}"
+
+    items = [projection] if value is not None else _split_top_level(projection)
+    aggregates = _plan_aggregates(items)
+    if aggregates is not None:
+        select_list, names = aggregates
+        return QueryPlan(
+            f"SELECT {select_list} " + body.strip() + suffix,
+            aggregates=names,
+            value_aggregate=value is not None,
+        )
+
+    order_text = clause("ORDER BY")
+    if order_text is None:
+        if top is None and offset_text is None:
+            return None
+        if offset_text is not None:
+            query = query[: clauses["OFFSET"]].rstrip() + suffix
+        return QueryPlan(query, top=top, offset=offset, limit=limit)
+
+    descending = []
+    keys = []
+    for i, item in enumerate(_split_top_level(order_text[len("ORDER BY") :])):
+        match = re.match(r"^(.*?)\s+(ASC|DESC)$", item, flags=re.IGNORECASE | re.DOTALL)
+        if match is not None:
+            item = match.group(1)
+        descending.append(match is not None and match.group(2).upper() == "DESC")
+        keys.append(f'"k{i}": {item}')
+    if value is not None:
+        payload = projection
+    elif projection == "*":
+        alias = re.match(r"FROM\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", body, flags=re.I)
+        if alias is None:
+            return None
+        payload = alias.group(1)
+        if alias.group(2) is not None and alias.group(2).upper() not in (
+            "IN",
+            "JOIN",
+            "WHERE",
+        ):
+            payload = alias.group(2)
+    else:
+        fields = []
+        unnamed = 0
+        for item in items:
+            expr, alias = _split_alias(item)
+            if alias is not None:
+                name = alias
+            else:
+                if _PATH.match(item) is None:
+                    unnamed += 1
+                name = _output_name(item, unnamed)
+            fields.append(f"{orjson.dumps(name).decode('utf8')}: {expr}")
+        payload = "{" + ", ".join(fields) + "}"
+    rewritten = (
+        f'SELECT {top_text}VALUE {{"p": {payload}, {", ".join(keys)}}} '
+        + body.strip()
+        + " "
+        + order_text.strip()
+        + suffix
+    )
+    return QueryPlan(
+        rewritten, top=top, offset=offset, limit=limit, descending=descending
+    )
+
+
+def _plan_aggregates(
+    items: list[str],
+) -> tuple[str, list[tuple[str, str]]] | None:
+    select_list = []
+    names: list[tuple[str, str, str]] = []
+    unnamed = 0
+    for i, item in enumerate(items):
+        expr, alias = _split_alias(item)
+        if alias is not None:
+            name = alias
+        else:
+            unnamed += 1
+            name = f"${unnamed}"
+        match = _aggregate(expr)
+        if match is None:
+            return None
+        func = match.group(1).upper()
+        part = f"__a{i}"
+        if func == "AVG":
+            select_list.append(f"SUM({match.group(2)}) AS {part}s")
+            select_list.append(f"{_COUNT_NUMBERS.format(match.group(2))} AS {part}n")
+        else:
+            select_list.append(f"{func}({match.group(2)}) AS {part}")
+        names.append((part, name, func))
+    if len(names) == 0:
+        return None
+    return (", ".join(select_list), names)
+
+
+def _rank(value: Any) -> tuple[int, Any]:
+    """Order values like Cosmos: undefined, null, bool, number, string."""
+    if value is None:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, 0)
+
+
+class _SortKey:
+    __slots__ = ("descending", "values")
+
+    def __init__(self, doc: dict[str, Any], descending: list[bool]):
+        self.values = [
+            _rank(doc[f"k{i}"]) if f"k{i}" in doc else (0, 0)
+            for i in range(len(descending))
+        ]
+        self.descending = descending
+
+    def __lt__(self, other: _SortKey) -> bool:
+        for mine, theirs, desc in zip(self.values, other.values, self.descending):
+            if mine == theirs:
+                continue
+            return mine > theirs if desc else mine < theirs
+        return False
+
+
+async def iter_documents(
+    pages: AsyncIterator[httpx.Response],
+) -> AsyncGenerator[Any, None]:
+    """Flatten response pages into their Documents."""
+    try:
+        async for resp in pages:
+            for doc in orjson.loads(resp.content)["Documents"]:
+                yield doc
+    finally:
+        if hasattr(pages, "aclose"):
+            await pages.aclose()  # type: ignore
+
+
+async def merge_ordered(
+    iterators: list[AsyncIterator[Any]], descending: list[bool]
+) -> AsyncGenerator[Any, None]:
+    """
+    Streaming k-way merge of per pk range results that are each already sorted.
+
+    Only the current document of each range is held so memory is bounded by
+    a page per range no matter how large the result is.
+
+    Args:
+        iterators (list[AsyncIterator]): Sorted documents of each pk range.
+        descending (list[bool]): Sort direction of each ORDER BY key.
+
+    Returns
+    -------
+        AsyncGenerator: The documents in global order
+    """
+    heap: list[tuple[_SortKey, int, Any]] = []
+
+    async def advance(i: int):
+        try:
+            doc = await iterators[i].__anext__()
+        except StopAsyncIteration:
+            return
+        heapq.heappush(heap, (_SortKey(doc, descending), i, doc))
+
+    try:
+        await asyncio.gather(*[advance(i) for i in range(len(iterators))])
+        while len(heap) > 0:
+            _, i, doc = heapq.heappop(heap)
+            yield doc
+            await advance(i)
+    finally:
+        await _close(iterators)
+
+
+async def interleave(
+    iterators: list[AsyncIterator[Any]],
+) -> AsyncGenerator[Any, None]:
+    """
+    Read every iterator concurrently and yield items as they arrive.
+
+    Each iterator runs ahead by at most one item so memory stays bounded.
+    Closing the generator cancels whatever is still in flight.
+
+    Args:
+        iterators (list[AsyncIterator]): Items of each pk range.
+
+    Returns
+    -------
+        AsyncGenerator: Items in arrival order
+    """
+    queue: asyncio.Queue[tuple[str, Any]] = asyncio.Queue(maxsize=len(iterators))
+
+    async def produce(iterator: AsyncIterator[Any]):
+        try:
+            async for item in iterator:
+                await queue.put(("item", item))
+        except Exception as err:
+            await queue.put(("error", err))
+        else:
+            await queue.put(("done", None))
+
+    tasks = [asyncio.ensure_future(produce(x)) for x in iterators]
+    running = len(tasks)
+    try:
+        while running > 0:
+            kind, item = await queue.get()
+            if kind == "done":
+                running -= 1
+            elif kind == "error":
+                raise item
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _close(iterators)
+
+
+async def collect_unordered(
+    iterators: list[AsyncIterator[Any]], limit: int | None = None
+) -> list[Any]:
+    """
+    Read every iterator concurrently, cancelling the rest once `limit` is hit.
+
+    Args:
+        iterators (list[AsyncIterator]): Documents of each pk range.
+        limit (int, optional): Stop after this many documents.
+
+    Returns
+    -------
+        list[Any]: Up to `limit` documents in arrival order
+    """
+    results: list[Any] = []
+    if limit is not None and limit <= 0:
+        await _close(iterators)
+        return results
+    merged = interleave(iterators)
+    try:
+        async for doc in merged:
+            results.append(doc)
+            if limit is not None and len(results) >= limit:
+                break
+    finally:
+        await merged.aclose()
+    return results
+
+
+async def _collect(iterator: AsyncIterator[Any]) -> list[Any]:
+    return [x async for x in iterator]
+
+
+async def _close(iterators: list[AsyncIterator[Any]]):
+    for iterator in iterators:
+        if hasattr(iterator, "aclose"):
+            with contextlib.suppress(Exception):
+                await iterator.aclose()  # type: ignore
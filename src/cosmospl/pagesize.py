@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import threading
+
+
+class PageSizer:
+    """
+    Picks x-ms-max-item-count per pk range from the pages it has returned.
+
+    Each pk range starts at `initial` items. After every page the average
+    document size of that range is updated and the next page asks for as many
+    items as fit in `target_bytes`. With `target_seconds` the size is also
+    scaled by how far the last page's latency was from the target, and the
+    smaller of the two wins. A page never grows more than `max_growth` times
+    the previous one, so a single cheap page can't cause a memory spike, while
+    shrinking takes effect immediately.
+
+    Args:
+        target_bytes (int, optional): Response bytes to aim for per page.
+        target_seconds (float, optional): Latency to aim for per page.
+        initial (int): Items asked for by the first page of a range.
+        minimum (int): Fewest items ever asked for.
+        maximum (int): Most items ever asked for.
+        max_growth (float): Largest factor between consecutive page sizes.
+        smoothing (float): Weight of the newest page in the average document
+        size, between 0 and 1.
+    """
+
+    def __init__(
+        self,
+        target_bytes: int | None = 1_000_000,
+        target_seconds: float | None = None,
+        *,
+        initial: int = 100,
+        minimum: int = 10,
+        maximum: int = 10_000,
+        max_growth: float = 2.0,
+        smoothing: float = 0.5,
+    ):
+        if target_bytes is None and target_seconds is None:
+            msg = "need target_bytes or target_seconds"
+            raise ValueError(msg)
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_growth = max_growth
+        self.smoothing = smoothing
+        self._sizes: dict[str, int] = {}
+        self._doc_bytes: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def size(self, pk_id: str | int | None = None) -> int:
+        """Items to ask for in the next page of `pk_id`."""
+        return self._sizes.get(_key(pk_id), self.initial)
+
+    def observe(
+        self,
+        pk_id: str | int | None,
+        requested: int,
+        items: int,
+        size: int,
+        seconds: float,
+    ):
+        """
+        Update the page size of `pk_id` from a received page.
+
+        Args:
+            pk_id (str | int, optional): The pk range the page came from.
+            requested (int): The max item count the page asked for.
+            items (int): Documents in the page.
+            size (int): Bytes in the page.
+            seconds (float): Time the page took.
+        """
+        key = _key(pk_id)
+        with self._lock:
+            candidates = [requested * self.max_growth]
+            if items > 0:
+                doc_bytes = size / items
+                if key in self._doc_bytes:
+                    doc_bytes = (
+                        self.smoothing * doc_bytes
+                        + (1 - self.smoothing) * self._doc_bytes[key]
+                    )
+                self._doc_bytes[key] = doc_bytes
+            if self.target_bytes is not None and key in self._doc_bytes:
+                candidates.append(self.target_bytes / self._doc_bytes[key])
+            if self.target_seconds is not None and seconds > 0:
+                candidates.append(requested * self.target_seconds / seconds)
+            self._sizes[key] = max(
+                self.minimum, min(self.maximum, int(min(candidates)))
+            )
+
+    def reset(self):
+        """Forget everything observed."""
+        with self._lock:
+            self._sizes = {}
+            self._doc_bytes = {}
+
+
+def _key(pk_id: str | int | None) -> str:
+    # "" stands for a query routed by partition key or across partitions
+    return "" if pk_id is None else str(pk_id)
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import struct
+from typing import Any, Sequence, TypeAlias, Union
+
+import orjson
+
+# A single level of a partition key. {} stands for a missing (undefined) value
+PartitionKeyValue: TypeAlias = Union[str, int, float, bool, dict, None]
+# One value, or one value per level of a hierarchical key (a prefix of the
+# levels for queries)
+PartitionKey: TypeAlias = Union[PartitionKeyValue, Sequence[PartitionKeyValue]]
+
+UNDEFINED: dict = {}
+
+# Type markers of the binary encoding partition key values are hashed from
+_NULL = b"\x01"
+_FALSE = b"\x02"
+_TRUE = b"\x03"
+_NUMBER = b"\x05"
+_STRING = b"\x08"
+_UNDEFINED = b"\x00"
+
+_MASK = (1 << 64) - 1
+
+
+def key_values(partition_key: PartitionKey) -> list[PartitionKeyValue]:
+    """A partition key as its list of level values."""
+    if isinstance(partition_key, (list, tuple)):
+        return list(partition_key)
+    return [partition_key]  # type: ignore
+
+
+def partition_key_header(partition_key: PartitionKey) -> str:
+    """
+    The x-ms-documentdb-partitionkey header for a partition key.
+
+    Args:
+        partition_key: A str, number, bool, or a list with one value per level
+        of a hierarchical key. Use [None] for a null key and [{}] for documents
+        without the partition key property.
+
+    Returns
+    -------
+        str: json array of the key's values
+    """
+    if isinstance(partition_key, str):
+        return orjson.dumps([partition_key]).decode()
+    return orjson.dumps(key_values(partition_key)).decode()
+
+
+def partition_key_paths(meta: dict[str, Any]) -> list[str]:
+    """Property paths of a container's partition key, without leading slashes."""
+    paths = meta.get("partitionKey", {}).get("paths", [])
+    return [path.lstrip("/") for path in paths]
+
+
+def is_hierarchical(meta: dict[str, Any]) -> bool:
+    """Whether a container has a hierarchical (MultiHash) partition key."""
+    return meta.get("partitionKey", {}).get("kind") == "MultiHash"
+
+
+def partition_key_of(
+    record: dict[str, Any], paths: list[str]
+) -> list[PartitionKeyValue] | None:
+    """
+    The partition key values of a document.
+
+    Args:
+        record (dict): The document.
+        paths (list[str]): Partition key paths, nested ones like "a/b".
+
+    Returns
+    -------
+        list | None: One value per path, {} for missing levels, None if the
+        document has none of them
+    """
+    values: list[PartitionKeyValue] = []
+    found = False
+    for path in paths:
+        value: Any = record
+        for part in path.split("/"):
+            if not isinstance(value, dict) or part not in value:
+                value = UNDEFINED
+                break
+            value = value[part]
+        else:
+            found = True
+        values.append(value)
+    return values if found else None
+
+
+def _rotl(x: int, r: int) -> int:
+    return ((x << r) | (x >> (64 - r))) & _MASK
+
+
+def _fmix(k: int) -> int:
+    k ^= k >> 33
+    k = (k * 0xFF51AFD7ED558CCD) & _MASK
+    k ^= k >> 33
+    k = (k * 0xC4CEB9FE1A85EC53) & _MASK
+    k ^= k >> 33
+    return k
+
+
+def murmurhash3_128(data: bytes, seed: int = 0) -> int:
+    """MurmurHash3 x64 128 bit, as h2 << 64 | h1."""
+    c1 = 0x87C37B91114253D5
+    c2 = 0x4CF5AD432745937F
+    h1 = h2 = seed
+    length = len(data)
+    end = length - length % 16
+    for i in range(0, end, 16):
+        k1 = int.from_bytes(data[i : i + 8], "little")
+        k2 = int.from_bytes(data[i + 8 : i + 16], "little")
+        h1 ^= (_rotl((k1 * c1) & _MASK, 31) * c2) & _MASK
+        h1 = (_rotl(h1, 27) + h2) & _MASK
+        h1 = (h1 * 5 + 0x52DCE729) & _MASK
+        h2 ^= (_rotl((k2 * c2) & _MASK, 33) * c1) & _MASK
+        h2 = (_rotl(h2, 31) + h1) & _MASK
+        h2 = (h2 * 5 + 0x38495AB5) & _MASK
+    tail = data[end:]
+    if len(tail) > 8:
+        k2 = int.from_bytes(tail[8:], "little")
+        h2 ^= (_rotl((k2 * c2) & _MASK, 33) * c1) & _MASK
+    if len(tail) > 0:
+        k1 = int.from_bytes(tail[:8], "little")
+        h1 ^= (_rotl((k1 * c1) & _MASK, 31) * c2) & _MASK
+    h1 ^= length
+    h2 ^= length
+    h1 = (h1 + h2) & _MASK
+    h2 = (h2 + h1) & _MASK
+    h1 = _fmix(h1)
+    h2 = _fmix(h2)
+    h1 = (h1 + h2) & _MASK
+    h2 = (h2 + h1) & _MASK
+    return (h2 << 64) | h1
+
+
+def _encode(value: PartitionKeyValue) -> bytes:
+    if value is True:
+        return _TRUE
+    if value is False:
+        return _FALSE
+    if value is None:
+        return _NULL
+    if isinstance(value, (int, float)):
+        return _NUMBER + struct.pack("<d", value)
+    if isinstance(value, str):
+        return _STRING + value.encode() + b"\xff"
+    if value == UNDEFINED:
+        return _UNDEFINED
+    msg = f"unsupported partition key value {value!r}"
+    raise TypeError(msg)
+
+
+def effective_partition_key(values: Sequence[PartitionKeyValue]) -> str:
+    """
+    The effective partition key (EPK) of a hierarchical key or key prefix.
+
+    Each level is hashed on its own with MurmurHash3 and the 32 hex digit
+    hashes are concatenated, the same as Cosmos does for MultiHash keys, so
+    the EPKs of every document under a prefix start with the prefix's EPK.
+
+    Args:
+        values (Sequence): Values of the leading levels of the key.
+
+    Returns
+    -------
+        str: Upper case hex EPK
+    """
+    epk = []
+    for value in values:
+        hashed = murmurhash3_128(_encode(value))
+        # the top two bits are cleared so every EPK is below "FF"
+        hashed &= (1 << 126) - 1
+        epk.append(f"{hashed:032X}")
+    return "".join(epk)
+
+
+def prefix_epk_range(values: Sequence[PartitionKeyValue]) -> tuple[str, str]:
+    """EPK range [min, max) holding every document under a key prefix."""
+    low = effective_partition_key(values)
+    return (low, low + "FF")
+
+
+def overlapping_ranges(
+    pk_ranges: list[dict[str, Any]], epk_range: tuple[str, str]
+) -> dict[str, tuple[str, str]]:
+    """
+    The pk ranges an EPK range falls in, and the part of it in each.
+
+    Args:
+        pk_ranges (list[dict]): PartitionKeyRanges of the container.
+        epk_range (tuple[str, str]): [min, max) EPKs.
+
+    Returns
+    -------
+        dict[str, tuple[str, str]]: pk range id to the [min, max) within it
+    """
+    low, high = epk_range
+    overlaps = {}
+    for pk_range in pk_ranges:
+        range_low, range_high = pk_range["minInclusive"], pk_range["maxExclusive"]
+        if range_low < high and low < range_high:
+            overlaps[str(pk_range["id"])] = (max(low, range_low), min(high, range_high))
+    return overlaps
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+import httpx
+import orjson
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+# Status codes that mean the region, rather than the request, is the problem
+UNAVAILABLE_STATUS = (503,)
+
+
+class Region:
+    """A readable location of the account and its observed latencies."""
+
+    __slots__ = ("endpoint", "latencies", "name", "unavailable_until")
+
+    def __init__(self, name: str, endpoint: str, samples: int = 200):
+        while endpoint[-1] == "/":
+            endpoint = endpoint[0:-1]
+        self.name = name
+        self.endpoint = endpoint
+        self.latencies: deque[float] = deque(maxlen=samples)
+        self.unavailable_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        """Whether the region isn't being skipped after a failure."""
+        return time.monotonic() >= self.unavailable_until
+
+    @property
+    def latency(self) -> float:
+        """Median of recent latencies, infinite when never measured."""
+        if len(self.latencies) == 0:
+            return float("inf")
+        ordered = sorted(self.latencies)
+        return ordered[len(ordered) // 2]
+
+    def percentile(self, q: float) -> float | None:
+        """The `q` quantile of recent latencies, None when never measured."""
+        if len(self.latencies) == 0:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(q * (len(ordered) - 1))]
+
+    def __repr__(self) -> str:
+        return f"Region({self.name!r}, {self.endpoint!r})"
+
+
+class _Unavailable(Exception):
+    def __init__(self, resp: httpx.Response | None = None):
+        self.resp = resp
+        super().__init__()
+
+
+class RegionRouter:
+    """
+    Routes reads to the account's readable regions.
+
+    Regions are discovered from the account root resource. Reads go to the
+    available preferred locations first, in the given order, then to the
+    remaining regions from lowest to highest observed latency. A region that
+    fails with a connection error or 503 is skipped for `unavailable_for`
+    seconds and the read fails over to the next one. With `hedge` a second
+    request is sent to the next region once the first has taken longer than
+    its p95 latency, and whichever finishes first wins.
+
+    Args:
+        base_url (str): AccountEndpoint from the connection string.
+        preferred_locations (list[str], optional): Region names, e.g. "West US".
+        hedge (bool): Send hedged reads.
+        hedge_delay (float): Seconds to wait before hedging until a region has
+        enough latency samples for a p95.
+        unavailable_for (float): Seconds a failed region is skipped.
+        probe (bool): Time a request to every region on discovery so latency
+        ordering works from the start.
+        min_samples (int): Latency samples a region needs before its p95 is
+        used as the hedge delay.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        preferred_locations: Iterable[str] | None = None,
+        *,
+        hedge: bool = False,
+        hedge_delay: float = 0.1,
+        unavailable_for: float = 60.0,
+        probe: bool = True,
+        min_samples: int = 20,
+    ):
+        self.base_url = base_url
+        self.preferred_locations = [x.lower() for x in preferred_locations or []]
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.unavailable_for = unavailable_for
+        self.probe = probe
+        self.min_samples = min_samples
+        self.regions = [Region("default", base_url)]
+        self.write_regions: list[Region] = []
+        self.discovered = False
+        self._lock = asyncio.Lock()
+
+    async def discover(self, client: httpx.AsyncClient, headers: dict[str, str]):
+        """
+        Read the account's locations, once.
+
+        Falls back to the AccountEndpoint alone if the account can't be read.
+
+        Args:
+            client (httpx.AsyncClient): Client with Cosmos auth.
+            headers (dict[str, str]): Headers for an account level GET.
+        """
+        async with self._lock:
+            if self.discovered:
+                return
+            try:
+                resp = await client.get(self.base_url + "/", headers=headers)
+                resp.raise_for_status()
+                account = orjson.loads(resp.content)
+            except Exception:
+                self.discovered = True
+                return
+            readable = [
+                Region(x["name"], x["databaseAccountEndpoint"])
+                for x in account.get("readableLocations", [])
+            ]
+            self.write_regions = [
+                Region(x["name"], x["databaseAccountEndpoint"])
+                for x in account.get("writableLocations", [])
+            ]
+            if len(readable) > 0:
+                self.regions = readable
+            if self.probe and len(self.regions) > 1:
+                await asyncio.gather(
+                    *[self._probe(client, x, headers) for x in self.regions]
+                )
+            self.discovered = True
+
+    async def _probe(
+        self, client: httpx.AsyncClient, region: Region, headers: dict[str, str]
+    ):
+        start = time.perf_counter()
+        try:
+            resp = await client.get(region.endpoint + "/", headers=headers)
+        except httpx.TransportError:
+            self.mark_unavailable(region)
+            return
+        if resp.status_code in UNAVAILABLE_STATUS:
+            self.mark_unavailable(region)
+        else:
+            region.latencies.append(time.perf_counter() - start)
+
+    def read_order(self) -> list[Region]:
+        """Regions to try for a read, best first, unavailable ones last."""
+
+        def rank(region: Region):
+            name = region.name.lower()
+            if name in self.preferred_locations:
+                return (0, self.preferred_locations.index(name), 0.0)
+            return (1, 0, region.latency)
+
+        ordered = sorted(self.regions, key=rank)
+        return [x for x in ordered if x.available] + [
+            x for x in ordered if not x.available
+        ]
+
+    def mark_unavailable(self, region: Region):
+        """Skip `region` for `unavailable_for` seconds."""
+        region.unavailable_until = time.monotonic() + self.unavailable_for
+
+    def hedge_after(self, region: Region) -> float:
+        """Seconds to wait on `region` before sending a hedged request."""
+        if len(region.latencies) < self.min_samples:
+            return self.hedge_delay
+        p95 = region.percentile(0.95)
+        assert p95 is not None
+        return p95
+
+    async def _attempt(
+        self,
+        region: Region,
+        request: Callable[[str], Awaitable[httpx.Response]],
+    ) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            resp = await request(region.endpoint)
+        except httpx.TransportError as err:
+            raise _Unavailable from err
+        if resp.status_code in UNAVAILABLE_STATUS:
+            raise _Unavailable(resp)
+        region.latencies.append(time.perf_counter() - start)
+        return resp
+
+    async def send(
+        self, request: Callable[[str], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """
+        Send a read to the best region with hedging and failover.
+
+        Args:
+            request (Callable[[str], Awaitable[httpx.Response]]): Sends the read
+            to the given endpoint.
+
+        Returns
+        -------
+            httpx.Response: The first response that wasn't a region failure
+        """
+        candidates = self.read_order()
+        pending: dict[asyncio.Future, Region] = {}
+        failure: _Unavailable | None = None
+        hedged = False
+        tried = 0
+
+        def launch():
+            nonlocal tried
+            region = candidates[tried]
+            tried += 1
+            pending[asyncio.ensure_future(self._attempt(region, request))] = region
+
+        launch()
+        try:
+            while len(pending) > 0:
+                timeout = None
+                if self.hedge and not hedged and tried < len(candidates):
+                    timeout = self.hedge_after(candidates[0])
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if len(done) == 0:
+                    hedged = True
+                    launch()
+                    continue
+                for task in done:
+                    region = pending.pop(task)
+                    try:
+                        return task.result()
+                    except _Unavailable as err:
+                        failure = err
+                        self.mark_unavailable(region)
+                        if tried < len(candidates):
+                            launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        assert failure is not None
+        if failure.resp is not None:
+            return failure.resp
+        assert failure.__cause__ is not None
+        raise failure.__cause__
@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import warnings
+from typing import TYPE_CHECKING, Any, Iterator
+
+import orjson
+
+if TYPE_CHECKING:
+    import polars as plt
+
+    from cosmospl import Cosmos
+    from cosmospl.partition import PartitionKey
+
+_COMPARISONS = {
+    "Eq": "=",
+    "NotEq": "!=",
+    "Lt": "<",
+    "LtEq": "<=",
+    "Gt": ">",
+    "GtEq": ">=",
+}
+# When the column is on the right hand side, e.g. `1 < pl.col("a")`
+_FLIPPED = {
+    "Eq": "Eq",
+    "NotEq": "NotEq",
+    "Lt": "Gt",
+    "LtEq": "GtEq",
+    "Gt": "Lt",
+    "GtEq": "LtEq",
+}
+_MISSING = object()
+
+
+class _Pushdown:
+    """
+    Translate a polars predicate into a Cosmos SQL WHERE clause.
+
+    Only comparisons between a column and a literal, null checks and AND/OR
+    combinations of those are translated. Anything else is left for polars to
+    filter client side. A conjunct of an AND that can't be translated is
+    dropped, which widens the server side filter but never narrows it, so the
+    client side filter always sees every row it needs.
+    """
+
+    def __init__(self, partition_key_name: str | None = None):
+        self.partition_key_name = partition_key_name
+        self.params: list[dict[str, Any]] = []
+        self.partition_key: str | None = None
+        self.exact = True
+
+    def where(self, predicate: plt.Expr) -> str | None:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                tree = orjson.loads(predicate.meta.serialize(format="json"))
+        except Exception:
+            self.exact = False
+            return None
+        self._find_partition_key(tree)
+        return self._translate(tree)
+
+    def _find_partition_key(self, node: Any):
+        if not isinstance(node, dict) or "BinaryExpr" not in node:
+            return
+        binary = node["BinaryExpr"]
+        if binary["op"] in ("And", "LogicalAnd"):
+            self._find_partition_key(binary["left"])
+            self._find_partition_key(binary["right"])
+        elif binary["op"] == "Eq" and self.partition_key_name is not None:
+            for col_node, lit_node in (
+                (binary["left"], binary["right"]),
+                (binary["right"], binary["left"]),
+            ):
+                value = _literal(lit_node)
+                if _column(col_node) == self.partition_key_name and isinstance(
+                    value, str
+                ):
+                    self.partition_key = value
+
+    def _param(self, value: Any) -> str:
+        name = f"@p{len(self.params)}"
+        self.params.append({"name": name, "value": value})
+        return name
+
+    def _translate(self, node: Any) -> str | None:
+        mark = len(self.params)
+        sql = self._translate_node(node)
+        if sql is None:
+            del self.params[mark:]
+        return sql
+
+    def _translate_node(self, node: Any) -> str | None:
+        if isinstance(node, dict) and "BinaryExpr" in node:
+            binary = node["BinaryExpr"]
+            op = binary["op"]
+            if op in ("And", "LogicalAnd"):
+                left = self._translate(binary["left"])
+                right = self._translate(binary["right"])
+                if left is not None and right is not None:
+                    return f"({left} AND {right})"
+                self.exact = False
+                return left if left is not None else right
+            if op in ("Or", "LogicalOr"):
+                left = self._translate(binary["left"])
+                right = self._translate(binary["right"])
+                if left is not None and right is not None:
+                    return f"({left} OR {right})"
+                self.exact = False
+                return None
+            if op in _COMPARISONS:
+                name, value = _column(binary["left"]), _literal(binary["right"])
+                if name is None:
+                    name, value = _column(binary["right"]), _literal(binary["left"])
+                    op = _FLIPPED[op]
+                if name is not None and value is not _MISSING and value is not None:
+                    return f"{_path(name)} {_COMPARISONS[op]} {self._param(value)}"
+        elif isinstance(node, dict) and "Function" in node:
+            function = node["Function"]
+            inputs = function.get("input", [])
+            kind = function.get("function")
+            if len(inputs) == 1 and (name := _column(inputs[0])) is not None:
+                if kind == {"Boolean": "IsNull"}:
+                    return f"(NOT IS_DEFINED({_path(name)}) OR IS_NULL({_path(name)}))"
+                if kind == {"Boolean": "IsNotNull"}:
+                    return f"(IS_DEFINED({_path(name)}) AND NOT IS_NULL({_path(name)}))"
+        self.exact = False
+        return None
+
+
+def _column(node: Any) -> str | None:
+    if isinstance(node, dict) and isinstance(node.get("Column"), str):
+        return node["Column"]
+    return None
+
+
+def _literal(node: Any) -> Any:
+    if not isinstance(node, dict) or "Literal" not in node:
+        return _MISSING
+    lit = node["Literal"]
+    while isinstance(lit, dict):
+        if "value" in lit:
+            lit = lit["value"]
+        elif len(lit) == 1 and next(iter(lit)) in ("Dyn", "Scalar"):
+            lit = next(iter(lit.values()))
+        else:
+            break
+    if not isinstance(lit, dict) or len(lit) != 1:
+        return _MISSING
+    ((kind, value),) = lit.items()
+    if kind == "Null":
+        return None
+    if kind in ("String", "StringOwned") and isinstance(value, str):
+        return value
+    if kind == "Boolean" and isinstance(value, bool):
+        return value
+    if (
+        kind.startswith(("Int", "UInt"))
+        and isinstance(value, int)
+        and not isinstance(value, bool)
+    ):
+        return value
+    if kind.startswith("Float") and isinstance(value, (int, float)):
+        return value
+    return _MISSING
+
+
+def _path(name: str) -> str:
+    return "c[" + orjson.dumps(name).decode("utf8") + "]"
+
+
+def build_scan_query(
+    with_columns: list[str] | None = None,
+    predicate: plt.Expr | None = None,
+    n_rows: int | None = None,
+    partition_key_name: str | None = None,
+) -> tuple[str, list[dict[str, Any]], str | None]:
+    """
+    Build the Cosmos SQL for a scan with projection and predicate pushdown.
+
+    Args:
+        with_columns (list[str], optional): Columns polars needs or None for all.
+        predicate (pl.Expr, optional): Filter polars wants applied.
+        n_rows (int, optional): Max rows polars wants.
+        partition_key_name (str, optional): Name of the partition key property.
+        If the predicate pins it to one value that value is returned so the
+        query can be sent to a single partition.
+
+    Returns
+    -------
+        tuple[str, list[dict[str, Any]], str | None]: query, params, partition_key
+    """
+    pushdown = _Pushdown(partition_key_name)
+    where = pushdown.where(predicate) if predicate is not None else None
+    # TOP is only safe when every row Cosmos returns survives the client side filter
+    top = f"TOP {int(n_rows)} " if n_rows is not None and pushdown.exact else ""
+    if with_columns is None:
+        select = "*"
+    else:
+        columns = list(with_columns)
+        if predicate is not None:
+            columns.extend(
+                x for x in predicate.meta.root_names() if x not in with_columns
+            )
+        fields = ", ".join(
+            f"{orjson.dumps(x).decode('utf8')}: {_path(x)}" for x in columns
+        )
+        select = "VALUE {" + fields + "}"
+    query = f"SELECT {top}{select} FROM c"
+    if where is not None:
+        query += f" WHERE {where}"
+    return (query, pushdown.params, pushdown.partition_key)
+
+
+def scan_cosmos(
+    cosdb: Cosmos,
+    *,
+    schema: dict[str, plt.DataType] | None = None,
+    partition_key: PartitionKey | None = None,
+    max_item: int | str | None = None,
+    infer_schema_length: int = 100,
+) -> plt.LazyFrame:
+    """
+    Lazily scan a Cosmos container as a polars LazyFrame.
+
+    Selected columns, simple filters, `head` limits and partition key equality
+    are pushed down into the Cosmos SQL and partition key header so only the
+    needed data leaves the server. Pages are streamed back as batches.
+
+    Args:
+        cosdb (Cosmos): The container to scan.
+        schema (dict[str, pl.DataType], optional): Schema of the container. If
+        None it is inferred from the first `infer_schema_length` documents.
+        partition_key (PartitionKey, optional): Restrict the scan to one partition
+        key, or a prefix of a hierarchical one.
+        max_item (int | str, optional): Max items per request. Defaults to the
+        batch size polars asks for.
+        infer_schema_length (int): Documents to read when inferring the schema.
+
+    Returns
+    -------
+        pl.LazyFrame: The lazy scan
+    """
+    try:
+        import polars as pl
+        from polars.io.plugins import register_io_source
+    except ModuleNotFoundError:
+        msg = "can't use scan_cosmos without polars installed"
+        raise ValueError(msg) from None
+
+    from cosmospl import get_inner_content
+
+    partition_key_name = getattr(cosdb, "partition_key_name", None)
+
+    def read_pages(
+        query: str,
+        params: list[dict[str, Any]],
+        pk: PartitionKey | None,
+        page_size: int | str | None,
+    ) -> Iterator[plt.DataFrame]:
+        with cosdb._sync_client() as client:
+            pk_ids, epk_ranges = cosdb._targets_sync(client, pk)
+            for pk_id in pk_ids:
+                for resp in cosdb._query_pages_sync(
+                    client,
+                    query,
+                    params,
+                    pk,
+                    page_size,
+                    pk_id,
+                    epk_range=epk_ranges.get(pk_id),  # type: ignore
+                ):
+                    if resp.headers.get("x-ms-item-count") == "0":
+                        continue
+                    yield pl.read_json(get_inner_content(resp.content))
+
+    def infer_schema() -> dict[str, plt.DataType]:
+        frames = []
+        rows = 0
+        for df in read_pages(
+            f"SELECT TOP {int(infer_schema_length)} * FROM c",
+            [],
+            partition_key,
+            max_item,
+        ):
+            frames.append(df)
+            rows += df.height
+            if rows >= infer_schema_length:
+                break
+        if len(frames) == 0:
+            return {}
+        return dict(pl.concat(frames, how="diagonal_relaxed").schema)
+
+    def source(
+        with_columns: list[str] | None,
+        predicate: plt.Expr | None,
+        n_rows: int | None,
+        batch_size: int | None,
+    ) -> Iterator[plt.DataFrame]:
+        query, params, pk = build_scan_query(
+            with_columns, predicate, n_rows, partition_key_name
+        )
+        if partition_key is not None:
+            pk = partition_key
+        needed = list(full_schema) if with_columns is None else with_columns
+        if predicate is not None:
+            needed = needed + [
+                x for x in predicate.meta.root_names() if x not in needed
+            ]
+        remaining = n_rows
+        for df in read_pages(query, params, pk, max_item or batch_size):
+            df = df.select(
+                pl.col(name).cast(full_schema[name], strict=False)
+                if name in df.columns
+                else pl.lit(None, full_schema.get(name, pl.Null)).alias(name)
+                for name in needed
+            )
+            if predicate is not None:
+                df = df.filter(predicate)
+            if with_columns is not None:
+                df = df.select(with_columns)
+            if remaining is not None:
+                df = df.head(remaining)
+                remaining -= df.height
+            if df.height > 0:
+                yield df
+            if remaining is not None and remaining <= 0:
+                return
+
+    full_schema = schema if schema is not None else infer_schema()
+    return register_io_source(source, schema=full_schema)
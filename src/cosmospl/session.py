@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import threading
+
+
+class VectorToken:
+    """
+    The session token of one pk range.
+
+    Tokens look like `version#globalLsn#regionId=localLsn#...`, older accounts
+    send just an LSN. Merging two tokens of the same range keeps the highest
+    LSN seen for every region so neither read-your-writes guarantee is lost.
+    """
+
+    __slots__ = ("global_lsn", "regions", "simple", "version")
+
+    def __init__(self, token: str):
+        parts = token.split("#")
+        self.simple = len(parts) == 1
+        if self.simple:
+            self.version = 0
+            self.global_lsn = int(parts[0])
+            self.regions: dict[str, int] = {}
+        else:
+            self.version = int(parts[0])
+            self.global_lsn = int(parts[1])
+            self.regions = {
+                (y := x.split("=", maxsplit=1))[0]: int(y[1]) for x in parts[2:]
+            }
+
+    def merge(self, other: VectorToken) -> VectorToken:
+        """Combine with another token of the same pk range."""
+        if self.simple or other.simple:
+            return self if self.global_lsn >= other.global_lsn else other
+        higher, lower = (
+            (self, other) if self.version >= other.version else (other, self)
+        )
+        merged = VectorToken.__new__(VectorToken)
+        merged.simple = False
+        merged.version = higher.version
+        merged.global_lsn = max(self.global_lsn, other.global_lsn)
+        merged.regions = {
+            region: max(lsn, lower.regions.get(region, lsn))
+            for region, lsn in higher.regions.items()
+        }
+        return merged
+
+    def __str__(self) -> str:
+        if self.simple:
+            return str(self.global_lsn)
+        return "#".join(
+            [str(self.version), str(self.global_lsn)]
+            + [f"{region}={lsn}" for region, lsn in self.regions.items()]
+        )
+
+
+class SessionTokens:
+    """
+    Session tokens tracked per pk range.
+
+    Responses carry `rangeId:token` pairs (comma separated when a request
+    touched several ranges). Each range keeps its own merged token, so
+    concurrent responses from different ranges never overwrite each other and
+    a request only sends the token of the range it targets.
+    """
+
+    def __init__(self):
+        self._tokens: dict[str, VectorToken] = {}
+        self._compound: str | None = None
+        self._lock = threading.Lock()
+
+    def update(self, header: str | None):
+        """Merge the x-ms-session-token header of a response."""
+        if not header:
+            return
+        with self._lock:
+            for pair in header.split(","):
+                range_id, sep, token = pair.strip().partition(":")
+                if sep == "":
+                    continue
+                try:
+                    parsed = VectorToken(token)
+                except ValueError:
+                    continue
+                if range_id in self._tokens:
+                    parsed = self._tokens[range_id].merge(parsed)
+                self._tokens[range_id] = parsed
+            self._compound = None
+
+    def get(self, pk_id: str | int | None = None) -> str | None:
+        """
+        The x-ms-session-token to send.
+
+        Args:
+            pk_id (str | int, optional): The pk range the request targets. When
+            None (the range isn't known) every range's token is sent and the
+            server uses the one that applies.
+
+        Returns
+        -------
+            str | None: The token or None if nothing has been seen yet
+        """
+        if pk_id is not None:
+            token = self._tokens.get(str(pk_id))
+            return None if token is None else f"{pk_id}:{token}"
+        if self._compound is None and len(self._tokens) > 0:
+            with self._lock:
+                self._compound = ",".join(
+                    f"{range_id}:{token}" for range_id, token in self._tokens.items()
+                )
+        return self._compound
+
+    def clear(self):
+        """Forget every token."""
+        with self._lock:
+            self._tokens = {}
+            self._compound = None
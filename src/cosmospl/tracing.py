@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import sys
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Protocol
+
+# httpcore trace events bounding each phase of a request
+_PHASES = {
+    "connect_ms": (
+        "connect_tcp.started",
+        ("start_tls.complete", "connect_tcp.complete"),
+    ),
+    "send_ms": ("send_request_headers.started", ("send_request_body.complete",)),
+    "ttfb_ms": ("send_request_body.complete", ("receive_response_headers.complete",)),
+    "download_ms": (
+        "receive_response_body.started",
+        ("receive_response_body.complete",),
+    ),
+}
+
+
+# The operation span requests and decodes are started under. A context variable
+# so the tasks a query fans out to inherit it
+current_span: ContextVar[Span | None] = ContextVar("cosmospl_span", default=None)
+
+
+class Span(Protocol):
+    """The part of an OpenTelemetry span cosmospl uses."""
+
+    def set_attribute(self, key: str, value: Any) -> Any:
+        """Set an attribute."""
+        ...
+
+    def record_exception(self, exception: BaseException) -> Any:
+        """Record the exception that ended the span."""
+        ...
+
+    def end(self) -> Any:
+        """End the span."""
+        ...
+
+
+class Tracer(Protocol):
+    """
+    Receives cosmospl's spans.
+
+    An OpenTelemetry tracer (`opentelemetry.trace.get_tracer(...)`) satisfies
+    this as is, as does `RecordingTracer`. Spans are
+    - cosmos.query / cosmos.read: one per call, with the row count.
+    - cosmos.request: one per HTTP request including each retry and page,
+      with the pk range id, retry attempt, status, response bytes, request
+      charge and how long signing, connecting, sending, waiting for the first
+      byte and downloading the body took.
+    - cosmos.decode: turning responses into the requested return type.
+
+    Request and decode spans are children of their operation's span.
+    """
+
+    def start_span(
+        self,
+        name: str,
+        context: Any = None,
+        attributes: dict[str, Any] | None = None,
+    ) -> Span:
+        """Start a span, ended by cosmospl, under the parent `context`."""
+        ...
+
+
+def parent_context(span: Span) -> Any:
+    """
+    The context to start children of `span` in.
+
+    OpenTelemetry tracers take the parent as a Context holding the span, other
+    tracers get the span itself.
+    """
+    if "opentelemetry.trace" in sys.modules:
+        from opentelemetry import trace
+
+        if isinstance(span, trace.Span):
+            return trace.set_span_in_context(span)
+    return span
+
+
+def start_span(tracer: Tracer, name: str, attributes: dict[str, Any]) -> Span:
+    """Start a span under the current operation's span, if any."""
+    parent = current_span.get()
+    if parent is None:
+        return tracer.start_span(name, attributes=attributes)
+    return tracer.start_span(
+        name, context=parent_context(parent), attributes=attributes
+    )
+
+
+class RequestTimer:
+    """
+    Phase timings of one HTTP request.
+
+    Passed to httpx as the trace extension, which calls it at the start and
+    end of each step httpcore takes. Steps a request skips, such as connecting
+    on a reused connection, are left out.
+    """
+
+    __slots__ = ("marks",)
+
+    def __init__(self):
+        self.marks: dict[str, float] = {}
+
+    def __call__(self, event: str, info: dict[str, Any]):
+        """Note when a step started or completed."""
+        # events look like "http11.send_request_headers.started"
+        self.marks[event.split(".", 1)[-1]] = time.perf_counter()
+
+    async def atrace(self, event: str, info: dict[str, Any]):
+        """Async form of the callback, for async clients."""
+        self(event, info)
+
+    def phases(self) -> dict[str, float]:
+        """Milliseconds spent in each phase that happened."""
+        timings = {}
+        for phase, (start, ends) in _PHASES.items():
+            if start not in self.marks:
+                continue
+            for end in ends:
+                if end in self.marks:
+                    timings[phase] = (self.marks[end] - self.marks[start]) * 1000
+                    break
+        return timings
+
+
+class SpanRecord:
+    """A span kept by `RecordingTracer`."""
+
+    __slots__ = ("attributes", "end_time", "exception", "name", "parent", "start_time")
+
+    def __init__(
+        self,
+        name: str,
+        attributes: dict[str, Any] | None = None,
+        parent: SpanRecord | None = None,
+    ):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_time = time.perf_counter()
+        self.end_time: float | None = None
+        self.exception: BaseException | None = None
+
+    def set_attribute(self, key: str, value: Any):
+        """Set an attribute."""
+        self.attributes[key] = value
+
+    def record_exception(self, exception: BaseException):
+        """Record the exception that ended the span."""
+        self.exception = exception
+
+    def end(self):
+        """End the span."""
+        self.end_time = time.perf_counter()
+
+    @property
+    def duration_ms(self) -> float | None:
+        """Milliseconds between start and end, None while running."""
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) * 1000
+
+    def __repr__(self) -> str:
+        return f"SpanRecord({self.name!r}, {self.duration_ms}, {self.attributes!r})"
+
+
+class RecordingTracer:
+    """
+    Keeps the most recent spans in memory, for debugging without OpenTelemetry.
+
+    Args:
+        max_spans (int): Spans kept, oldest are dropped first.
+    """
+
+    def __init__(self, max_spans: int = 10_000):
+        self.spans: deque[SpanRecord] = deque(maxlen=max_spans)
+
+    def start_span(
+        self,
+        name: str,
+        context: SpanRecord | None = None,
+        attributes: dict[str, Any] | None = None,
+    ) -> SpanRecord:
+        """Start a span and keep it, `context` being its parent."""
+        span = SpanRecord(name, attributes, context)
+        self.spans.append(span)
+        return span
+
+    def clear(self):
+        """Forget every span."""
+        self.spans.clear()
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+
+import cosmospl
+from cosmospl import CosAuth
+
+
+@pytest.mark.parametrize(
+    ("path", "link"),
+    [
+        ("/dbs/d/colls/c/docs", "dbs/d/colls/c"),
+        ("//dbs/d/colls/c/pkranges", "dbs/d/colls/c"),
+        ("/dbs/d/colls/c", "dbs/d/colls/c"),
+        # items whose id is the name of a feed are still items
+        ("/dbs/d/colls/c/docs/docs", "dbs/d/colls/c/docs/docs"),
+        ("/dbs/d/colls/c/sprocs/udfs", "dbs/d/colls/c/sprocs/udfs"),
+        ("/", ""),
+    ],
+)
+def test_signed_resource_link(monkeypatch: pytest.MonkeyPatch, path: str, link: str):
+    signed = []
+    monkeypatch.setattr(
+        cosmospl, "_gen_sig", lambda *args: signed.append(args[2]) or "sig"
+    )
+    request = httpx.Request("GET", "https://a" + path, headers={"resource_type": "x"})
+    next(CosAuth("key").auth_flow(request))
+    assert signed == [link]
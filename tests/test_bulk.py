@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import datetime
+
+import orjson
+import pytest
+
+from cosmospl.bulk import iter_document_bodies
+
+pl = pytest.importorskip("polars")
+
+
+def test_iter_document_bodies():
+    df = pl.DataFrame({"id": [1, 2], "a": ["x", "y"], "b": [1, None]})
+    assert list(iter_document_bodies(df, ["a", "b"], chunk_rows=1)) == [
+        (b'{"id":"1","a":"x","b":1}', ["x", 1]),
+        (b'{"id":"2","a":"y","b":null}', ["y", None]),
+    ]
+
+
+def test_iter_document_bodies_null_key():
+    df = pl.DataFrame({"id": ["1", "2"], "pk": [None, 5]})
+    keys = [key for _, key in iter_document_bodies(df, ["pk"])]
+    assert keys == [[None], [5]]
+
+
+def test_iter_document_bodies_without_key():
+    df = pl.DataFrame({"id": ["1"]})
+    assert list(iter_document_bodies(df, ["pk"])) == [(b'{"id":"1"}', None)]
+
+
+def test_iter_document_bodies_key_as_written():
+    df = pl.DataFrame(
+        {
+            "id": ["1"],
+            "t": [datetime.datetime(2024, 1, 2, 3, 4, 5)],
+            "d": pl.Series(["1.50"]).cast(pl.Decimal(10, 2)),
+        }
+    )
+    ((body, key),) = iter_document_bodies(df, ["t", "d"])
+    assert key == [orjson.loads(body)["t"], orjson.loads(body)["d"]]
+    assert key == ["2024-01-02 03:04:05", "1.50"]
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from cosmospl import cache
+from cosmospl.cache import QueryCache
+
+if TYPE_CHECKING:
+    import pytest
+
+
+def test_lru_eviction():
+    entry = 10 + cache._ENTRY_OVERHEAD
+    query_cache = QueryCache(max_bytes=2 * entry, ttl=None)
+    query_cache.put("a", b"0123456789", "c", None, 0)
+    query_cache.put("b", b"0123456789", "c", None, 0)
+    assert query_cache.get("a") == b"0123456789"
+    # b is now the least recently used
+    query_cache.put("c", b"0123456789", "c", None, 0)
+    assert query_cache.get("b") is None
+    assert query_cache.get("a") is not None
+    assert query_cache.get("c") is not None
+    assert query_cache.nbytes == 2 * entry
+    assert (query_cache.hits, query_cache.misses) == (3, 1)
+
+
+def test_too_large_not_kept():
+    query_cache = QueryCache(max_bytes=100)
+    query_cache.put("a", b"x" * 100, "c", None, 0)
+    assert len(query_cache) == 0
+    assert query_cache.nbytes == 0
+
+
+def test_ttl(monkeypatch: pytest.MonkeyPatch):
+    now = 1000.0
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now)
+    query_cache = QueryCache(ttl=5)
+    query_cache.put("a", b"[]", "c", None, 0)
+    now += 4.9
+    assert query_cache.get("a") == b"[]"
+    now += 0.1
+    assert query_cache.get("a") is None
+    assert len(query_cache) == 0
+    assert query_cache.nbytes == 0
+
+
+def test_invalidate_hierarchical_prefix():
+    query_cache = QueryCache()
+    query_cache.put("prefix", b"[]", "c", ["a"], 0)
+    query_cache.put("full", b"[]", "c", ["a", 1], 0)
+    query_cache.put("other", b"[]", "c", ["b"], 0)
+    query_cache.put("cross", b"[]", "c", None, 0)
+    query_cache.put("true", b"[]", "c", ["a", True], 0)
+    query_cache.put("elsewhere", b"[]", "d", ["a"], 0)
+    query_cache.invalidate("c", ["a", 1])
+    # the prefix and cross partition results can hold the written document, a
+    # result for the key ["a", true] can't even though 1 == True in Python
+    assert {
+        x
+        for x in ["prefix", "full", "other", "cross", "true", "elsewhere"]
+        if query_cache.get(x) is not None
+    } == {"other", "true", "elsewhere"}
+
+
+def test_invalidate_whole_container():
+    query_cache = QueryCache()
+    query_cache.put("a", b"[]", "c", ["a"], 0)
+    query_cache.put("b", b"[]", "d", ["a"], 0)
+    query_cache.invalidate("c", None)
+    assert query_cache.get("a") is None
+    assert query_cache.get("b") == b"[]"
+
+
+def test_put_after_invalidation_rejected():
+    query_cache = QueryCache()
+    generation = query_cache.generation("c")
+    # a write lands while the query is in flight
+    query_cache.invalidate("c", ["a"])
+    query_cache.put("q", b"[]", "c", ["b"], generation)
+    assert query_cache.get("q") is None
+    # other containers' generations are unaffected
+    query_cache.put("q", b"[]", "d", None, generation)
+    assert query_cache.get("q") == b"[]"
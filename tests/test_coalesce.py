@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from cosmospl.coalesce import SingleFlight
+
+
+def test_shares_call():
+    flights = SingleFlight()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def main():
+        results = await asyncio.gather(*[flights.do("k", call) for _ in range(3)])
+        assert len(flights) == 0
+        # finished calls are forgotten
+        return results, await flights.do("k", call)
+
+    assert asyncio.run(main()) == ([1, 1, 1], 2)
+
+
+def test_failure_not_cached():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fail_once():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ValueError
+        return calls
+
+    async def main():
+        with pytest.raises(ValueError):
+            await flights.do("k", fail_once)
+        return await flights.do("k", fail_once)
+
+    assert asyncio.run(main()) == 2
+
+
+def test_cancelled_waiter_leaves_call_running():
+    flights = SingleFlight()
+
+    async def main():
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flights.do("k", call))
+        second = asyncio.ensure_future(flights.do("k", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await second
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_last_waiter_cancels_call():
+    flights = SingleFlight()
+
+    async def main():
+        cancelled = asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.ensure_future(flights.do("k", call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return len(flights)
+
+    assert asyncio.run(main()) == 0
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import orjson
+import pytest
+
+from cosmospl import join_documents
+
+
+def _page(docs: list[dict]) -> bytes:
+    return (
+        b'{"_rid":"x","Documents":'
+        + orjson.dumps(docs)
+        + b',"_count":'
+        + str(len(docs)).encode()
+        + b"}"
+    )
+
+
+PAGES = [
+    _page([{"id": "1"}, {"id": "2"}, {"id": "3"}]),
+    _page([]),
+    _page([{"id": "4", "v": [1, {"a": "]"}]}, {"id": "5"}, {"id": "6"}]),
+]
+
+
+def test_join_documents():
+    assert orjson.loads(join_documents(PAGES)) == [
+        {"id": "1"},
+        {"id": "2"},
+        {"id": "3"},
+        {"id": "4", "v": [1, {"a": "]"}]},
+        {"id": "5"},
+        {"id": "6"},
+    ]
+    assert join_documents([_page([])]) == b"[]"
+
+
+@pytest.mark.parametrize("limit", [0, 1, 3, 4, 5, 6, 10])
+def test_join_documents_limit(limit: int):
+    expected = orjson.loads(join_documents(PAGES))[:limit]
+    assert orjson.loads(join_documents(PAGES, limit)) == expected
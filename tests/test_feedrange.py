@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, AsyncIterator
+
+import httpx
+import orjson
+import pytest
+
+from cosmospl.feedrange import scan_container, split_epk_range
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_split_epk_range():
+    # "FF" pads to FF00..., a quarter of which is 3FC0...
+    assert split_epk_range("", "FF", 4) == [
+        "",
+        "3FC".ljust(32, "0"),
+        "7F8".ljust(32, "0"),
+        "BF4".ljust(32, "0"),
+        "FF",
+    ]
+
+
+def test_split_epk_range_narrow():
+    low = "22E342F38A486A088463DFF7838A5963"
+    high = "22E342F38A486A088463DFF7838A5965"
+    # can't split finer than single EPKs
+    assert split_epk_range(low, high, 10) == [
+        low,
+        "22E342F38A486A088463DFF7838A5964",
+        high,
+    ]
+    assert split_epk_range("", "FF", 1) == ["", "FF"]
+
+
+class _Container:
+    """Two pages per sub-range, the first continued with "more"."""
+
+    def __init__(self):
+        self.requests: list[tuple[str, str | None]] = []
+
+    async def _pk_range_list(self) -> list[dict[str, Any]]:
+        return [{"id": "0", "minInclusive": "", "maxExclusive": "FF"}]
+
+    async def _query_pages(
+        self,
+        query: str,
+        params: Any,
+        partition_key: Any,
+        max_item: Any,
+        pk_id: str,
+        max_retries: Any,
+        continuation: str | None = None,
+        epk_range: tuple[str, str] = ("", ""),
+    ) -> AsyncIterator[httpx.Response]:
+        self.requests.append((epk_range[0], continuation))
+        if continuation is None:
+            yield self._page(epk_range[0], 1, "more")
+        yield self._page(epk_range[0], 2, None)
+
+    @staticmethod
+    def _page(low: str, n: int, continuation: str | None) -> httpx.Response:
+        headers = {"x-ms-item-count": "1"}
+        if continuation is not None:
+            headers["x-ms-continuation"] = continuation
+        return httpx.Response(200, json=[{"range": low, "n": n}], headers=headers)
+
+    def _decode_pages(self, pages: list[httpx.Response], return_as: str) -> Any:
+        return orjson.loads(pages[0].content)
+
+
+def test_scan_container_resumes(tmp_path: Path):
+    container = _Container()
+    checkpoint = tmp_path / "scan.json"
+    seen = []
+
+    def fail_on_second_range(page: list[dict]):
+        if page[0]["range"] != "" and page[0]["n"] == 2:
+            msg = "handler failed"
+            raise RuntimeError(msg)
+        seen.extend(page)
+
+    kwargs: dict[str, Any] = {
+        "workers": 1,
+        "splits_per_range": 2,
+        "checkpoint": checkpoint,
+    }
+    with pytest.raises(RuntimeError):
+        asyncio.run(scan_container(container, fail_on_second_range, **kwargs))  # type: ignore
+    assert checkpoint.exists()
+    middle = split_epk_range("", "FF", 2)[1]
+    assert seen == [
+        {"range": "", "n": 1},
+        {"range": "", "n": 2},
+        {"range": middle, "n": 1},
+    ]
+
+    container.requests.clear()
+    rows = asyncio.run(scan_container(container, seen.extend, **kwargs))  # type: ignore
+    # the finished sub-range isn't read again, the other picks up where it was
+    assert container.requests == [(middle, "more")]
+    assert seen[-1] == {"range": middle, "n": 2}
+    assert rows == 4
+    assert not checkpoint.exists()
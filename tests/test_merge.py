@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator
+
+import pytest
+
+from cosmospl.merge import plan_query
+
+
+async def _docs(docs: list[Any]) -> AsyncIterator[Any]:
+    for doc in docs:
+        yield doc
+
+
+def test_order_by_offset_limit():
+    plan = plan_query("SELECT * FROM c ORDER BY c.ts OFFSET 5 LIMIT 10")
+    assert plan is not None
+    assert (
+        plan.query
+        == 'SELECT VALUE {"p": c, "k0": c.ts} FROM c ORDER BY c.ts OFFSET 0 LIMIT 15'
+    )
+    assert (plan.offset, plan.limit, plan.descending) == (5, 10, [False])
+
+
+def test_order_by_offset_limit_params():
+    plan = plan_query(
+        "SELECT * FROM c WHERE c.a = 1 ORDER BY c.ts DESC OFFSET @o LIMIT @l",
+        [{"name": "@o", "value": 2}, {"name": "@l", "value": 3}],
+    )
+    assert plan is not None
+    assert plan.query == (
+        'SELECT VALUE {"p": c, "k0": c.ts} FROM c WHERE c.a = 1 '
+        "ORDER BY c.ts DESC OFFSET 0 LIMIT 5"
+    )
+    assert (plan.offset, plan.limit, plan.descending) == (2, 3, [True])
+
+
+def test_order_by():
+    plan = plan_query("SELECT c.id, c.ts AS t FROM c ORDER BY c.ts, c.id DESC")
+    assert plan is not None
+    assert plan.query == (
+        'SELECT VALUE {"p": {"id": c.id, "t": c.ts}, "k0": c.ts, "k1": c.id} '
+        "FROM c ORDER BY c.ts, c.id DESC"
+    )
+    assert plan.descending == [False, True]
+    assert plan.top is None
+    assert plan.limit is None
+
+
+def test_property_named_like_keyword():
+    plan = plan_query("SELECT c.from, c.ts FROM c ORDER BY c.ts")
+    assert plan is not None
+    assert plan.query == (
+        'SELECT VALUE {"p": {"from": c.from, "ts": c.ts}, "k0": c.ts} '
+        "FROM c ORDER BY c.ts"
+    )
+    plan = plan_query("SELECT * FROM c WHERE c.offset > 3 ORDER BY c.ts")
+    assert plan is not None
+    assert plan.query == (
+        'SELECT VALUE {"p": c, "k0": c.ts} FROM c WHERE c.offset > 3 ORDER BY c.ts'
+    )
+
+
+def test_alias_without_as():
+    plan = plan_query('SELECT c.name n, c.a = true, "x" y FROM c ORDER BY c.ts')
+    assert plan is not None
+    assert plan.query == (
+        'SELECT VALUE {"p": {"n": c.name, "$1": c.a = true, "y": "x"}, "k0": c.ts} '
+        "FROM c ORDER BY c.ts"
+    )
+    plan = plan_query("SELECT MAX(c.a) m FROM c")
+    assert plan is not None
+    assert plan.aggregates == [("__a0", "m", "MAX")]
+
+
+@pytest.mark.parametrize(
+    ("query", "alias"),
+    [
+        ("SELECT * FROM c AS x ORDER BY x.ts", "x"),
+        ("SELECT * FROM c x ORDER BY x.ts", "x"),
+        ("SELECT * FROM c AS x ORDER BY x.ts OFFSET 1 LIMIT 2", "x"),
+        ("SELECT * FROM c WHERE c.a > 1 ORDER BY c.ts", "c"),
+    ],
+)
+def test_order_by_alias(query: str, alias: str):
+    plan = plan_query(query)
+    assert plan is not None
+    assert plan.query.startswith(f'SELECT VALUE {{"p": {alias}, "k0": {alias}.ts}}')
+
+
+def test_order_by_top():
+    plan = plan_query("SELECT TOP 3 c.id FROM c ORDER BY c.ts")
+    assert plan is not None
+    assert plan.query == (
+        'SELECT TOP 3 VALUE {"p": {"id": c.id}, "k0": c.ts} FROM c ORDER BY c.ts'
+    )
+    assert plan.top == 3
+
+
+def test_top():
+    plan = plan_query("SELECT TOP 3 * FROM c")
+    assert plan is not None
+    assert plan.query == "SELECT TOP 3 * FROM c"
+    assert plan.top == 3
+    assert plan.descending is None
+
+
+def test_offset_limit():
+    plan = plan_query("SELECT * FROM c OFFSET 2 LIMIT 3")
+    assert plan is not None
+    assert plan.query == "SELECT * FROM c OFFSET 0 LIMIT 5"
+    assert (plan.offset, plan.limit) == (2, 3)
+
+
+def test_aggregates():
+    plan = plan_query("SELECT AVG(c.v) AS a, COUNT(1) FROM c WHERE c.x = 1")
+    assert plan is not None
+    assert plan.query == (
+        "SELECT SUM(c.v) AS __a0s, SUM(IS_NUMBER(c.v) ? 1 : 0) AS __a0n, "
+        "COUNT(1) AS __a1 FROM c WHERE c.x = 1"
+    )
+    assert plan.aggregates == [("__a0", "a", "AVG"), ("__a1", "$1", "COUNT")]
+    merged = asyncio.run(
+        plan.merge(
+            [
+                _docs([{"__a0s": 6, "__a0n": 3, "__a1": 3}]),
+                _docs([{"__a0s": 4, "__a0n": 1, "__a1": 1}]),
+            ]
+        )
+    )
+    assert merged == [{"a": 2.5, "$1": 4}]
+
+
+def test_value_aggregate():
+    plan = plan_query("SELECT VALUE MAX(c.v) FROM c")
+    assert plan is not None
+    assert plan.query == "SELECT MAX(c.v) AS __a0 FROM c"
+    merged = asyncio.run(plan.merge([_docs([{"__a0": 2}]), _docs([{}])]))
+    assert merged == [2]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT * FROM c",
+        "SELECT DISTINCT c.a FROM c ORDER BY c.a",
+        "SELECT c.a, COUNT(1) FROM c GROUP BY c.a",
+        "SELECT TOP @n * FROM c",
+        "SELECT MAX(c.a) - MIN(c.a) AS spread FROM c",
+    ],
+)
+def test_no_plan(query: str):
+    assert plan_query(query) is None
+
+
+def test_merge_order_by_offset_limit():
+    plan = plan_query("SELECT * FROM c ORDER BY c.ts OFFSET 1 LIMIT 3")
+    assert plan is not None
+
+    def page(values: list[int]) -> AsyncIterator[Any]:
+        return _docs([{"p": {"ts": x}, "k0": x} for x in values])
+
+    merged = asyncio.run(plan.merge([page([1, 4, 5]), page([2, 3, 6])]))
+    assert merged == [{"ts": 2}, {"ts": 3}, {"ts": 4}]
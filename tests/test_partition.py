@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import pytest
+
+from cosmospl.partition import (
+    effective_partition_key,
+    murmurhash3_128,
+    overlapping_ranges,
+    partition_key_header,
+    partition_key_of,
+    prefix_epk_range,
+)
+
+# EPKs of MultiHash keys as computed by the azure-cosmos Python SDK (4.17.1)
+SDK_EPKS = [
+    (["redmond"], "22E342F38A486A088463DFF7838A5963"),
+    ([""], "32E9366E637A71B4E710384B2F4970A0"),
+    (
+        ["redmond", "98052"],
+        "22E342F38A486A088463DFF7838A596336C8BBEC5EEB4676558994E4D8DF79A7",
+    ),
+    ([5], "19C08621B135968252FB34B4CF66F811"),
+    ([5.5], "0E2EE47829D1AF775EEFB6540FD1D0ED"),
+    ([-1], "19938E7A936C1C5B9E3AE842BBC16839"),
+    ([True], "0E711127C5B5A8E4726AC6DD306A3E59"),
+    ([False], "2FE1BE91E90A3439635E0E9E37361EF2"),
+    ([None], "378867E4430E67857ACE5C908374FE16"),
+    ([{}], "11622DAA78F835834610ABE56EFF5CB5"),
+    (["ünïcode"], "2F659D3306868DADA79E432F48A53236"),
+    (["x" * 200], "34C859F7FC157766FF5170B1131F5F2F"),
+    (
+        ["a", 1, None],
+        "3A5381E1114EB8D3FCC90795045B49B720CD98B339BA78A5D0CF6953B87070B0"
+        "378867E4430E67857ACE5C908374FE16",
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    ("data", "expected"),
+    [
+        (b"", 0),
+        (b"a", 0xE6B53A48510E895A85555565F6597889),
+        (
+            b"The quick brown fox jumps over the lazy dog",
+            0x7A433CA9C49A9347E34BBC7BBC071B6C,
+        ),
+        (bytes(range(33)), 0x55AC8073A7D6A30B7D41281BFABA4612),
+    ],
+)
+def test_murmurhash3_128(data: bytes, expected: int):
+    assert murmurhash3_128(data) == expected
+
+
+@pytest.mark.parametrize(("values", "expected"), SDK_EPKS)
+def test_effective_partition_key(values: list, expected: str):
+    assert effective_partition_key(values) == expected
+
+
+def test_prefix_epk_range():
+    low, high = prefix_epk_range(["redmond", "98052"])
+    assert low == SDK_EPKS[2][1]
+    assert high == SDK_EPKS[2][1] + "FF"
+    # every full key under the prefix falls in the range
+    full = effective_partition_key(["redmond", "98052", "x"])
+    assert low <= full < high
+
+
+def test_overlapping_ranges():
+    pk_ranges = [
+        {"id": "0", "minInclusive": "", "maxExclusive": "20"},
+        {"id": "1", "minInclusive": "20", "maxExclusive": "22E342F38A486A08"},
+        {"id": "2", "minInclusive": "22E342F38A486A08", "maxExclusive": "80"},
+        {"id": "3", "minInclusive": "80", "maxExclusive": "FF"},
+    ]
+    low, high = prefix_epk_range(["redmond"])
+    assert overlapping_ranges(pk_ranges, (low, high)) == {"2": (low, high)}
+    # a range split inside the prefix's EPKs
+    split = low + "40"
+    pk_ranges = [
+        {"id": "4", "minInclusive": "", "maxExclusive": split},
+        {"id": "5", "minInclusive": split, "maxExclusive": "FF"},
+    ]
+    assert overlapping_ranges(pk_ranges, (low, high)) == {
+        "4": (low, split),
+        "5": (split, high),
+    }
+
+
+def test_partition_key_header():
+    assert partition_key_header("x") == '["x"]'
+    assert partition_key_header(5) == "[5]"
+    assert partition_key_header(True) == "[true]"
+    assert partition_key_header([None]) == "[null]"
+    assert partition_key_header(["a", 1]) == '["a",1]'
+
+
+def test_partition_key_of():
+    record = {"a": "x", "b": {"c": 2}, "n": None}
+    assert partition_key_of(record, ["a", "b/c"]) == ["x", 2]
+    assert partition_key_of(record, ["a", "b/d"]) == ["x", {}]
+    assert partition_key_of(record, ["n"]) == [None]
+    assert partition_key_of(record, ["z"]) is None
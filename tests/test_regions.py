@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+import pytest
+
+from cosmospl.regions import Region, RegionRouter
+
+
+def _router(**kwargs) -> RegionRouter:
+    router = RegionRouter("https://acct-default", **kwargs)
+    router.regions = [
+        Region("West US", "https://acct-westus/"),
+        Region("East US", "https://acct-eastus"),
+        Region("North Europe", "https://acct-northeurope"),
+    ]
+    return router
+
+
+def _names(regions: list[Region]) -> list[str]:
+    return [x.name for x in regions]
+
+
+def test_read_order():
+    router = _router(preferred_locations=["north europe"])
+    router.regions[0].latencies.extend([0.05, 0.04])
+    router.regions[1].latencies.extend([0.01])
+    # preferred first, then by latency, never measured last
+    assert _names(router.read_order()) == ["North Europe", "East US", "West US"]
+    router.mark_unavailable(router.regions[2])
+    assert _names(router.read_order()) == ["East US", "West US", "North Europe"]
+    assert router.regions[0].endpoint == "https://acct-westus"
+
+
+def test_failover():
+    router = _router(preferred_locations=["West US", "East US"])
+    sent = []
+
+    async def request(endpoint: str) -> httpx.Response:
+        sent.append(endpoint)
+        if endpoint == "https://acct-westus":
+            return httpx.Response(503)
+        if endpoint == "https://acct-eastus":
+            msg = "down"
+            raise httpx.ConnectError(msg)
+        return httpx.Response(200)
+
+    resp = asyncio.run(router.send(request))
+    assert resp.status_code == 200
+    assert sent == [
+        "https://acct-westus",
+        "https://acct-eastus",
+        "https://acct-northeurope",
+    ]
+    # both failed regions are skipped by later reads
+    assert _names(router.read_order())[0] == "North Europe"
+
+
+def test_all_regions_down():
+    router = _router()
+
+    async def unavailable(endpoint: str) -> httpx.Response:
+        return httpx.Response(503)
+
+    async def unreachable(endpoint: str) -> httpx.Response:
+        msg = "down"
+        raise httpx.ConnectError(msg)
+
+    # the last region failure is what the caller gets
+    assert asyncio.run(router.send(unavailable)).status_code == 503
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(router.send(unreachable))
+
+
+def test_hedged_read():
+    router = _router(preferred_locations=["West US"], hedge=True, hedge_delay=0.01)
+    sent = []
+
+    async def request(endpoint: str) -> httpx.Response:
+        sent.append(endpoint)
+        if endpoint == "https://acct-westus":
+            await asyncio.sleep(1)
+        return httpx.Response(200, text=endpoint)
+
+    resp = asyncio.run(router.send(request))
+    # the hedge went to the next region and won
+    assert resp.text == "https://acct-eastus"
+    assert len(sent) == 2
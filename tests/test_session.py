@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from cosmospl.session import SessionTokens, VectorToken
+
+
+def test_vector_token_merge():
+    merged = VectorToken("1#100#1=20#2=5").merge(VectorToken("1#90#1=25#2=3"))
+    assert str(merged) == "1#100#1=25#2=5"
+    # the newer version's regions win, keeping the highest LSNs of both
+    merged = VectorToken("2#100#1=20").merge(VectorToken("1#120#1=30#3=9"))
+    assert str(merged) == "2#120#1=30"
+
+
+def test_vector_token_merge_simple():
+    assert str(VectorToken("7").merge(VectorToken("9"))) == "9"
+    assert str(VectorToken("9").merge(VectorToken("1#7#1=3"))) == "9"
+
+
+def test_session_tokens_update():
+    sessions = SessionTokens()
+    assert sessions.get() is None
+    sessions.update("0:1#10#1=5, 1:1#20#1=6")
+    sessions.update("0:1#8#1=7")
+    assert sessions.get("0") == "0:1#10#1=7"
+    assert sessions.get(1) == "1:1#20#1=6"
+    assert sessions.get("2") is None
+    assert sessions.get() == "0:1#10#1=7,1:1#20#1=6"
+
+
+def test_session_tokens_update_ignores_malformed():
+    sessions = SessionTokens()
+    sessions.update(None)
+    sessions.update("")
+    sessions.update("no-range,0:x#y,1:5")
+    assert sessions.get() == "1:5"
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import asyncio
+
+from cosmospl.tracing import RecordingTracer, RequestTimer, current_span, start_span
+
+
+def test_start_span_parent():
+    tracer = RecordingTracer()
+    assert start_span(tracer, "root", {}).parent is None
+    operation = tracer.start_span("cosmos.query")
+    token = current_span.set(operation)
+    try:
+        child = start_span(tracer, "cosmos.request", {"cosmos.page": 0})
+    finally:
+        current_span.reset(token)
+    assert child.parent is operation
+    assert child.attributes == {"cosmos.page": 0}
+
+
+def test_parent_inherited_by_tasks():
+    tracer = RecordingTracer()
+    operation = tracer.start_span("cosmos.query")
+
+    async def request():
+        return start_span(tracer, "cosmos.request", {})
+
+    async def main():
+        current_span.set(operation)
+        return await asyncio.gather(request(), request())
+
+    assert all(x.parent is operation for x in asyncio.run(main()))
+
+
+def test_request_timer_phases():
+    timer = RequestTimer()
+    timer.marks = {
+        "send_request_headers.started": 1.0,
+        "send_request_body.complete": 1.002,
+        "receive_response_headers.complete": 1.012,
+    }
+    phases = timer.phases()
+    assert set(phases) == {"send_ms", "ttfb_ms"}
+    assert round(phases["ttfb_ms"]) == 10